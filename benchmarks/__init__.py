@@ -0,0 +1,7 @@
+'''
+Benchmarks for FDSolver.
+
+generators.py builds seeded, synthetic FD sets; run.py times Solver operations
+on them and compares the results against a stored baseline.
+Run with `python -m benchmarks.run --help` from the root directory.
+'''
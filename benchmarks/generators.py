@@ -0,0 +1,76 @@
+from fdsolver.classes import FD, FDSet
+from random import Random
+
+# All generators are seeded and return (FDSet, relation), where the relation
+# holds every attribute of the schema.
+
+
+def attr_names(n, prefix='A'):
+    '''
+    Returns `n` attribute names, e.g. A0, A1, ...
+
+    :param n: The number of attributes.
+    :param prefix: What every name starts with.
+    :returns: A list of strings.
+    '''
+    return [f'{prefix}{i}' for i in range(n)]
+
+
+def chain(n):
+    '''
+    A0 -> A1 -> ... -> An-1: closures have to follow the whole chain,
+    and there is a single key {A0}.
+    '''
+    attrs = attr_names(n)
+    fdSet = FDSet(*[FD({attrs[i]}, {attrs[i+1]}) for i in range(n-1)])
+    return fdSet, set(attrs)
+
+
+def random_fds(n, fdCount, maxLhs=3, maxRhs=2, seed=0):
+    '''
+    `fdCount` random FDs over `n` attributes, with 1..maxLhs attributes on the
+    LHS and 1..maxRhs on the RHS.
+    '''
+    rng = Random(seed)
+    attrs = attr_names(n)
+    fdSet = FDSet()
+    for _ in range(fdCount):
+        lhs = rng.sample(attrs, rng.randint(1, min(maxLhs, n)))
+        rhs = rng.sample(attrs, rng.randint(1, min(maxRhs, n)))
+        fdSet.add_step(FD(set(lhs), set(rhs)))
+    return fdSet, set(attrs)
+
+
+def many_keys(n):
+    '''
+    Ai <-> Bi for every i: each key picks one of Ai, Bi for every i,
+    so there are 2^n keys over 2n attributes (adversarial for key search).
+    '''
+    attrsA, attrsB = attr_names(n, 'A'), attr_names(n, 'B')
+    fdSet = FDSet()
+    for a, b in zip(attrsA, attrsB):
+        fdSet.add_step(FD({a}, {b}))
+        fdSet.add_step(FD({b}, {a}))
+    return fdSet, set(attrsA) | set(attrsB)
+
+
+def wide_single_key(n, seed=0):
+    '''
+    K determines every other attribute, and the others only determine each
+    other (never K), so {K} is the only key of a wide schema.
+    '''
+    rng = Random(seed)
+    attrs = attr_names(n - 1)
+    fdSet = FDSet(FD({'K'}, set(attrs)))
+    for _ in range(n):
+        lhs = rng.sample(attrs, min(2, len(attrs)))
+        fdSet.add_step(FD(set(lhs), {rng.choice(attrs)}))
+    return fdSet, set(attrs) | {'K'}
+
+
+GENERATORS = {
+    'chain': chain,
+    'random': lambda n: random_fds(n, 2 * n),
+    'many_keys': lambda n: many_keys(n // 2),
+    'wide_single_key': wide_single_key,
+}
@@ -0,0 +1,118 @@
+import argparse
+import json
+import sys
+import time
+import tracemalloc
+from fdsolver.solver import Solver
+from benchmarks.generators import GENERATORS
+
+def _closures(fdSet, rel):
+    solver = Solver(fdSet)
+    return [solver.closure({attr}) for attr in sorted(rel)]
+
+
+# Every operation runs on a fresh Solver (so caches start cold),
+# except 'build', which times the Solver construction itself.
+OPERATIONS = {
+    'build': lambda fdSet, rel: Solver(fdSet),
+    'closure': _closures,
+    'keys': lambda fdSet, rel: Solver(fdSet).keys(rel),
+    'is_bcnf': lambda fdSet, rel: Solver(fdSet).is_bcnf(rel),
+    'find_bcnf_decomp': lambda fdSet, rel: Solver(fdSet).find_bcnf_decomp(rel),
+    'find_minimal_basis': lambda fdSet, rel: Solver(fdSet).find_minimal_basis(),
+}
+
+# Input sizes (number of attributes) each operation is feasible on
+SIZES = {
+    'build': (100, 1000, 5000),
+    'closure': (50, 200, 800),
+    'keys': (8, 12, 16),
+    'is_bcnf': (16, 32, 64),
+    'find_bcnf_decomp': (8, 12, 16),
+    'find_minimal_basis': (50, 200, 800),
+}
+
+
+def measure(operation, fdSet, rel, repeat):
+    '''
+    Times an operation (best of `repeat` runs) and then measures its peak
+    memory in a separate run, since tracing allocations skews the timing.
+
+    :returns: A tuple of (seconds, peak bytes).
+    '''
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        operation(fdSet, rel)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    tracemalloc.start()
+    operation(fdSet, rel)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak
+
+
+def run(operations, workloads, repeat):
+    '''
+    Runs every operation on every workload and size, yielding results as they come.
+
+    :returns: A generator of ('operation/workload/size', {'seconds', 'peak_bytes'}).
+    '''
+    for opName in operations:
+        for workload in workloads:
+            for size in SIZES[opName]:
+                fdSet, rel = GENERATORS[workload](size)
+                seconds, peak = measure(OPERATIONS[opName], fdSet, rel, repeat)
+                yield f'{opName}/{workload}/{size}', {'seconds': seconds, 'peak_bytes': peak}
+
+
+def report(results, baseline=None, threshold=1.5):
+    '''
+    Prints one line per result as it arrives, with the ratio against the
+    baseline if given.
+
+    :returns: A tuple of (all results as a dict, names of the results that got
+              slower than `threshold` times the baseline).
+    '''
+    collected = {}
+    regressions = []
+    print(f'{"benchmark":<40} {"time (ms)":>12} {"peak (KiB)":>12} {"vs baseline":>12}')
+    for name, result in results:
+        collected[name] = result
+        line = f'{name:<40} {result["seconds"]*1000:>12.2f} {result["peak_bytes"]/1024:>12.1f}'
+        if baseline and name in baseline:
+            ratio = result['seconds'] / max(baseline[name]['seconds'], 1e-9)
+            line += f' {ratio:>11.2f}x'
+            if ratio > threshold:
+                regressions.append(name)
+                line += '  SLOWER'
+        print(line, flush=True)
+    return collected, regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark FDSolver on synthetic FD sets.')
+    parser.add_argument('--ops', nargs='+', default=list(OPERATIONS), choices=list(OPERATIONS))
+    parser.add_argument('--workloads', nargs='+', default=list(GENERATORS), choices=list(GENERATORS))
+    parser.add_argument('--repeat', type=int, default=3, help='runs per timing (best is kept)')
+    parser.add_argument('--save', metavar='PATH', help='store the results as a baseline')
+    parser.add_argument('--baseline', metavar='PATH', help='compare against a stored baseline')
+    parser.add_argument('--threshold', type=float, default=1.5,
+                        help='slowdown ratio that counts as a regression')
+    args = parser.parse_args(argv)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    results, regressions = report(run(args.ops, args.workloads, args.repeat),
+                                  baseline, args.threshold)
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,18 +1,22 @@
 from collections.abc import Iterable
+from weakref import WeakSet
 
 class FD:
     '''
     Abstract representation of a functional dependency.
     Uses the Relation class defined earlier to express both sides of the FD.
     Not much use by itself; commonly used to construct FDSets.
+    FDs are immutable and hashable; both sides are stored as frozensets.
+    FDs use __slots__ (no per-instance __dict__), and the sorted sides used
+    for printing are only worked out the first time they are needed.
 
     Constructors:
     __init__()
 
     Operators:
     __str__, __repr__
-    __eq__
-    __or__, __ior__
+    __eq__, __hash__
+    __or__ (|= gives a new FD)
 
     Methods:
     decompose()
@@ -23,6 +27,8 @@ class FD:
     sortedLhs, sortedRhs (for pretty printing)
     '''
 
+    __slots__ = ('_lhs', '_rhs', '_hash', '_sortedLhs', '_sortedRhs')
+
     def __init__(self, lhs=None, rhs=None):
         # can be used like so:
         # FD('A>BC') or
@@ -32,37 +38,60 @@ class FD:
         if isinstance(lhs, str) and not rhs:
             # > is the only delimiter
             # elements will be uppercase characters
-            toConvert = lhs  # just for clarity
-            lhs, rhs = toConvert.split('>')
-            lhs, rhs = set(lhs.upper()), set(rhs.upper())
-
-        self.lhs = lhs
-        self.rhs = rhs
-        self.sortedLhs = sorted(list(lhs))
-        self.sortedRhs = sorted(list(rhs))
+            lhs, rhs = lhs.upper().split('>')
+
+        # frozenset() hands back a frozenset argument as is, without copying
+        self._lhs = frozenset(lhs)
+        self._rhs = frozenset(rhs)
+        self._hash = hash((self._lhs, self._rhs))
+
+    @property
+    def lhs(self):
+        return self._lhs
+
+    @property
+    def rhs(self):
+        return self._rhs
+
+    @property
+    def sortedLhs(self):
+        try:
+            return self._sortedLhs
+        except AttributeError:
+            self._sortedLhs = sorted(self._lhs)
+            return self._sortedLhs
+
+    @property
+    def sortedRhs(self):
+        try:
+            return self._sortedRhs
+        except AttributeError:
+            self._sortedRhs = sorted(self._rhs)
+            return self._sortedRhs
+
+    def __reduce__(self):
+        # String hashes differ between processes, so the hash is not pickled
+        return (FD, (self._lhs, self._rhs))
 
     def decompose(self):
         newFDSet = FDSet()
         for eachAfter in self.rhs:
-            newFD = FD(self.lhs, set(eachAfter))
+            newFD = FD(self.lhs, {eachAfter})
             newFDSet.add_step(newFD)
         return newFDSet
     
     def augment(self, new):
-        if isinstance(new, set):
+        if isinstance(new, (set, frozenset)):
             return FD(self.lhs | new, self.rhs | new)
         elif isinstance(new, str):
-            new_set = set(upper(new))
+            new_set = set(new.upper())
             return FD(self.lhs | new_set, self.rhs | new_set)
         else:
-            raise NotImplemented
+            raise TypeError('FDs can only be augmented with a set or a string')
 
     def untrivialize(self):
         # i.e. {A,C} -> {A,D} becomes {A,C} -> {D}
-        intersection = self.lhs & self.rhs
-        newLhs, newRhs = set(self.lhs), set(self.rhs)
-        newRhs -= intersection
-        return FD(self.lhs, newRhs)
+        return FD(self.lhs, self.rhs - self.lhs)
 
     def is_contained_in(self, rel):
         return self.lhs.issubset(rel) and self.rhs.issubset(rel)
@@ -75,22 +104,19 @@ class FD:
 
     def __eq__(self, other):
         if not isinstance(other, FD):
-            raise NotImplemented
-        return self.lhs == other.lhs and self.rhs == other.rhs
+            return NotImplemented
+        return self._hash == other._hash \
+                and self.lhs == other.lhs and self.rhs == other.rhs
+
+    def __hash__(self):
+        return self._hash
 
-    # Rule of Union mapped to the | and |= operator
+    # Rule of Union mapped to the | (and so also |=) operator
     def __or__(self, other):
         if not isinstance(other, FD):
-            raise NotImplemented
+            return NotImplemented
         if self.lhs == other.lhs:
             return FD(self.lhs, self.rhs | other.rhs)
-    
-    def __ior__(self, other):
-        if not isinstance(other, FD):
-            raise NotImplemented
-        if self.lhs == other.lhs:
-            self.rhs |= other.rhs
-            self.sortedRhs = sorted(list(self.rhs))
 
 
 class FDSet:
@@ -100,6 +126,11 @@ class FDSet:
     Can iterate and get/set using indexing.
     Mimicks a set, in that no duplicates exist.
     Ordered, but there's no point to ordering the FDs anyways.
+    A hash index is kept next to the ordered list, so adding, membership
+    and equality checks do not need to scan the FDs.
+    Every change bumps a version counter, which solvers use to notice that
+    their indexes and caches are stale. Subscribed solvers (see subscribe())
+    are also told which FDs came and went, so they can update incrementally.
 
 
     Constructors:
@@ -113,7 +144,9 @@ class FDSet:
     __eq__
 
     Methods:
-    add_step()
+    add_step(), add_steps()
+    remove_step()
+    subscribe(), unsubscribe()
 
     Properties:
     proof
@@ -121,14 +154,79 @@ class FDSet:
 
     def __init__(self, *args):
         self.proof = []
+        self._counts = {}  # FD -> number of positions holding it
+        self._version = 0
+        self._listeners = WeakSet()
         for eachFd in args:
             self.add_step(eachFd)
 
     def add_step(self, newFd):
         if not isinstance(newFd, FD):
-            raise NotImplemented
-        if newFd not in self.proof:
+            raise TypeError('FDSet only accepts an FD as input')
+        if newFd not in self._counts:
             self.proof.append(newFd)
+            self._counts[newFd] = 1
+            self._version += 1
+            if self._listeners:
+                self._notify(newFd, True)
+
+    def add_steps(self, fds):
+        '''
+        Adds every FD from an iterable (e.g. a generator), one at a time.
+
+        :param fds: The FDs to add.
+        :returns: None
+        '''
+        for eachFd in fds:
+            self.add_step(eachFd)
+
+    def remove_step(self, oldFd):
+        '''
+        Removes an FD (from every position holding it).
+
+        :param oldFd: The FD to remove.
+        :returns: None
+        :raises KeyError: If the FD is not in the set.
+        '''
+        if oldFd not in self:
+            raise KeyError(oldFd)
+        self.proof = [eachFd for eachFd in self.proof if eachFd != oldFd]
+        del self._counts[oldFd]
+        self._version += 1
+        if self._listeners:
+            self._notify(oldFd, False)
+
+    def subscribe(self, listener):
+        '''
+        Tells `listener` about every FD that enters or leaves the set, by
+        calling listener._fd_changed(fd, added). Only a weak reference is
+        kept, so subscribing does not keep the listener alive.
+
+        :param listener: The object to notify (usually a Solver).
+        :returns: None
+        '''
+        self._listeners.add(listener)
+
+    def unsubscribe(self, listener):
+        self._listeners.discard(listener)
+
+    def _notify(self, fd, added):
+        for eachListener in list(self._listeners):
+            eachListener._fd_changed(fd, added)
+
+    def __getstate__(self):
+        # Listeners are tied to this process, so they are not copied or pickled.
+        # The containers are copied too, so that a shallow copy never changes
+        # the original behind its listeners' back.
+        state = self.__dict__.copy()
+        del state['_listeners']
+        state['proof'] = list(self.proof)
+        state['_counts'] = dict(self._counts)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._listeners = WeakSet()
 
     def get_sub_fdset(self, rel):
         '''
@@ -162,7 +260,21 @@ class FDSet:
     def __setitem__(self, key, newFd):
         if not isinstance(newFd, FD):
             raise TypeError('FDSet only accepts an FD as input')
+        oldFd = self.proof[key]
+        if oldFd == newFd:
+            return
         self.proof[key] = newFd
+        if self._counts[oldFd] == 1:
+            del self._counts[oldFd]
+        else:
+            self._counts[oldFd] -= 1
+        self._counts[newFd] = self._counts.get(newFd, 0) + 1
+        self._version += 1
+        if self._listeners:
+            if oldFd not in self._counts:
+                self._notify(oldFd, False)
+            if self._counts[newFd] == 1:
+                self._notify(newFd, True)
 
     # Iterator subclass to allow for iteration
     class FDSetIterator:
@@ -182,15 +294,90 @@ class FDSet:
 
     # Implementing 'in' keyword
     def __contains__(self, item):
-        return item in self.proof
+        return isinstance(item, FD) and item in self._counts
 
     def __eq__(self, other):
         if not isinstance(other, FDSet):
             raise TypeError('Cannot compare FDSet to non-FDSet object')
-        ans = True
-        for eachFd in self:
-            if eachFd not in other:
-                ans = False
-                break
-        return ans and len(self) == len(other)
+        return len(self) == len(other) and self._counts.keys() == other._counts.keys()
+
+
+
+class AttrUniverse:
+    '''
+    Interned universe of attributes.
+    Each attribute is given its own bit, so that a relation can be stored as a
+    plain Python int (a bitmask) and subset tests and unions become single
+    integer operations.
+    Attributes passed on construction are interned in sorted order; anything
+    interned afterwards is appended, so existing masks never change meaning.
+
+    Constructors:
+    __init__()
+
+    Operators:
+    __len__
+    __iter__, __contains__
+
+    Methods:
+    intern(attr)
+    to_mask(rel), to_rel(mask)
+
+    Properties:
+    attrs (attribute of each bit, in bit order)
+    bits (attribute -> bit)
+    '''
+
+    def __init__(self, attrs=()):
+        self.attrs = []
+        self.bits = {}
+        for eachAttr in sorted(attrs):
+            self.intern(eachAttr)
+
+    def intern(self, attr):
+        bit = self.bits.get(attr)
+        if bit is None:
+            bit = 1 << len(self.attrs)
+            self.bits[attr] = bit
+            self.attrs.append(attr)
+        return bit
+
+    def to_mask(self, rel):
+        '''
+        Returns the bitmask of a relation, interning unseen attributes.
+
+        :param rel: The relation (any iterable of attributes).
+        :returns: An int.
+        '''
+        mask = 0
+        bits = self.bits
+        for eachAttr in rel:
+            bit = bits.get(eachAttr)
+            if bit is None:
+                bit = self.intern(eachAttr)
+            mask |= bit
+        return mask
+
+    def to_rel(self, mask):
+        '''
+        Returns the relation represented by a bitmask.
+
+        :param mask: The bitmask.
+        :returns: A set of attributes.
+        '''
+        rel = set()
+        attrs = self.attrs
+        while mask:
+            lowBit = mask & -mask
+            rel.add(attrs[lowBit.bit_length() - 1])
+            mask ^= lowBit
+        return rel
+
+    def __len__(self):
+        return len(self.attrs)
+
+    def __iter__(self):
+        return iter(self.attrs)
 
+    def __contains__(self, attr):
+        return attr in self.bits
@@ -1,65 +1,243 @@
-from fdsolver.classes import FD, FDSet
+from fdsolver.classes import FD, FDSet, AttrUniverse
 from fdsolver.solver import Solver
+import mmap
+import struct
+
+# Binary FD set format (all little-endian):
+#   header      magic, version, flags, attribute count, FD count, bytes per mask
+#   attributes  for each bit: u16 length + UTF-8 name
+#   masks       every LHS mask, then every RHS mask, each `bytes per mask` long
+#   index       (if flags & _FLAG_INDEX) attribute count + 1 u32 offsets, then
+#               u32 FD numbers: for each attribute, the FDs with it on the LHS
+_MAGIC = b'FDSB'
+_VERSION = 1
+_FLAG_INDEX = 1
+_HEADER = struct.Struct('<4sHHIII')
+_WORD_FORMATS = {1: 'B', 2: 'H', 4: 'I', 8: 'Q'}  # mask width -> struct code
 
 class FDReader:
-    def __init__(self, filepath):
+    '''
+    Reads FDs and relations from a text file, one per line, written as
+    `{A,B} -> {C}` and `{A,B}`. The file is parsed lazily in a single pass.
+    Lines that are neither are skipped, unless `strict` is set, in which case
+    a ValueError naming the offending line is raised.
+    '''
+
+    def __init__(self, filepath, strict=False):
         self.path = filepath
+        self.strict = strict
 
-    def get_objs(self):
-        output = []
+    def iter_objs(self):
+        '''
+        Lazily yields every FD and relation in the file, in order.
+
+        :returns: A generator of FDs and sets.
+        '''
         with open(self.path, 'r') as f:
-            for eachLine in f.readlines():
+            for lineNo, eachLine in enumerate(f, 1):
                 eachLine = eachLine.strip()
-                if self._is_line_fd(eachLine):
-                    lhs, rhs = eachLine.split(' -> ')
-                    newFd = FD(self._parse_to_rel(lhs), self._parse_to_rel(rhs))
-                    output.append(newFd)
-                elif self._is_line_rel(eachLine):
-                    newRel = self._parse_to_rel(eachLine)
-                    output.append(newRel)
-        return output
+                obj = self._parse_line(eachLine)
+                if obj is not None:
+                    yield obj
+                elif self.strict and eachLine:
+                    raise ValueError(f'{self.path}, line {lineNo}: '
+                                     f'not an FD or a relation: {eachLine!r}')
+
+    def iter_fds(self):
+        '''
+        Lazily yields every FD in the file, in order.
+
+        :returns: A generator of FDs.
+        '''
+        for obj in self.iter_objs():
+            if isinstance(obj, FD):
+                yield obj
+
+    def get_objs(self):
+        return list(self.iter_objs())
                     
     def get_fdset(self):
         newFdSet = FDSet()
-        with open(self.path, 'r') as f:
-            for eachLine in f.readlines():
-                eachLine = eachLine.strip()
-                if self._is_line_fd(eachLine):
-                    lhs, rhs = eachLine.split(' -> ')
-                    newFd = FD(self._parse_to_rel(lhs), self._parse_to_rel(rhs))
-                    newFdSet.add_step(newFd)
+        newFdSet.add_steps(self.iter_fds())
         return newFdSet
 
     def get_solver(self):
         return Solver(self.get_fdset())
-    
-    def _parse_to_rel(self, line):
-        firstBracket = line.find('{')
-        return set(line[firstBracket+1:-1].split(','))
-
-    def _is_line_rel(self, line):
-        hasBraces = line.startswith('{') and line.endswith('}')
-        hasNoDigits = line[1:-1].replace(' ','').replace(',','').isalpha()
-        return hasBraces and hasNoDigits
-    
-    def _is_line_fd(self, line):
-        if ' -> ' not in line:
-            return False
-
-        before, after = line.split(' -> ')
-        return self._is_line_rel(before) and self._is_line_rel(after)
+
+    def read_binary(self):
+        '''
+        Loads the FD set from a binary file written by FDWriter.write_binary(),
+        without building a solver or its index.
+
+        :returns: The FD set.
+        '''
+        attrs, lhsMasks, rhsMasks, _ = self._read_binary_masks(withIndex=False)
+        universe = AttrUniverse()
+        for eachAttr in attrs:
+            universe.intern(eachAttr)
+        newFdSet = FDSet()
+        newFdSet.add_steps(FD(universe.to_rel(lhs), universe.to_rel(rhs))
+                           for lhs, rhs in zip(lhsMasks, rhsMasks))
+        return newFdSet
+
+    def get_binary_solver(self):
+        '''
+        Builds a solver from a binary file written by FDWriter.write_binary().
+        The file is memory-mapped and the masks (and index, if present) are
+        handed to the solver as they are, so nothing is parsed or re-encoded,
+        and no FD objects are made until the solver's fdSet is used.
+
+        :returns: The solver.
+        '''
+        return Solver.from_masks(*self._read_binary_masks())
+
+    def _read_binary_masks(self, withIndex=True):
+        # Returns the attributes, LHS masks, RHS masks and index (or None)
+        with open(self.path, 'rb') as f, \
+                mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if len(mm) < _HEADER.size:
+                raise ValueError(f'{self.path}: not a binary FD file')
+            magic, version, flags, attrCount, fdCount, width = _HEADER.unpack_from(mm)
+            if magic != _MAGIC or version != _VERSION:
+                raise ValueError(f'{self.path}: not a binary FD file')
+
+            offset = _HEADER.size
+            attrs = []
+            for _ in range(attrCount):
+                self._check_size(mm, offset + 2)
+                (length,) = struct.unpack_from('<H', mm, offset)
+                offset += 2
+                self._check_size(mm, offset + length)
+                attrs.append(mm[offset:offset+length].decode('utf-8'))
+                offset += length
+
+            # The masks and the index are checked in full before any is read
+            size = fdCount * width
+            end = offset + 2 * size
+            if flags & _FLAG_INDEX:
+                self._check_size(mm, end + 4 * (attrCount + 1))
+                (userCount,) = struct.unpack_from('<I', mm, end + 4 * attrCount)
+                end += 4 * (attrCount + 1 + userCount)
+            self._check_size(mm, end)
+            lhsMasks = self._decode_masks(mm[offset:offset+size], width)
+            rhsMasks = self._decode_masks(mm[offset+size:offset+2*size], width)
+            offset += 2 * size
+
+            users = None
+            if withIndex and flags & _FLAG_INDEX:
+                starts = struct.unpack_from(f'<{attrCount+1}I', mm, offset)
+                offset += 4 * (attrCount + 1)
+                fdNumbers = struct.unpack_from(f'<{starts[-1]}I', mm, offset)
+                users = {}
+                for bitNo in range(attrCount):
+                    if starts[bitNo] != starts[bitNo+1]:
+                        users[1 << bitNo] = list(fdNumbers[starts[bitNo]:starts[bitNo+1]])
+        return attrs, lhsMasks, rhsMasks, users
+
+    def _check_size(self, mm, end):
+        if len(mm) < end:
+            raise ValueError(f'{self.path}: truncated binary FD file')
+
+    def _decode_masks(self, data, width):
+        # One slice holds a whole mask array. Masks of up to 8 bytes are
+        # unpacked together (narrower ones are zero-extended to 8 bytes first)
+        if width in _WORD_FORMATS:
+            return list(struct.unpack(f'<{len(data) // width}{_WORD_FORMATS[width]}', data))
+        if width < 8:
+            count = len(data) // width
+            padded = bytearray(8 * count)
+            for byteNo in range(width):
+                padded[byteNo::8] = data[byteNo::width]
+            return list(struct.unpack(f'<{count}Q', padded))
+        fromBytes = int.from_bytes
+        view = memoryview(data)
+        return [fromBytes(view[start:start+width], 'little')
+                for start in range(0, len(data), width)]
+
+    def _parse_line(self, line):
+        # Returns the FD or relation on the line, or None if it is neither
+        before, delimiter, after = line.partition(' -> ')
+        if not delimiter:
+            return self._parse_rel(line)
+        lhs, rhs = self._parse_rel(before), self._parse_rel(after)
+        if lhs is None or rhs is None:
+            return None
+        return FD(lhs, rhs)
+
+    def _parse_rel(self, text):
+        if not (text.startswith('{') and text.endswith('}')):
+            return None
+        inner = text[1:-1]
+        if not inner.replace(' ','').replace(',','').isalpha():
+            return None
+        return set(inner.split(','))
             
 
 class FDWriter:
+    '''
+    Writes FDs, FD sets and relations to a file, either as text (appended, one
+    per line, as their str() forms, which FDReader does not parse) or as a
+    compact binary FD set (which FDReader.read_binary() loads).
+    '''
+
     def __init__(self, filepath):
         self.path = filepath
 
     def write_obj(self, obj):
-        if isinstance(obj, set) \
-                or isinstance(obj, FD) \
-                or isinstance(obj, FDSet):
-            with open(self.path, 'a+') as f:
-                print(obj, file=f)
-        else:
-            raise NotImplemented
+        self.write_objs([obj])
+
+    def write_objs(self, objs):
+        '''
+        Appends several objects to the file with a single buffered write.
+
+        :param objs: The sets, FDs and FD sets to write.
+        :returns: None
+        '''
+        lines = []
+        for obj in objs:
+            if not isinstance(obj, (set, FD, FDSet)):
+                raise TypeError('FDWriter can only write sets, FDs and FDSets')
+            lines.append(str(obj) + '\n')
+        with open(self.path, 'a+') as f:
+            f.write(''.join(lines))
+
+    def write_binary(self, fdSet, index=True):
+        '''
+        Writes an FD set in the binary format (overwriting the file): an attribute
+        dictionary plus packed LHS/RHS bitmask arrays, and optionally the
+        attribute -> FD index so that loading solvers can skip building it.
+
+        :param fdSet: The FD set to write.
+        :param index: Flag to include the precomputed index.
+        :returns: None
+        '''
+        attrs = set()
+        for eachFd in fdSet:
+            attrs |= eachFd.lhs
+            attrs |= eachFd.rhs
+        universe = AttrUniverse(attrs)
+        width = max(1, (len(universe) + 7) // 8)
+        lhsMasks = [universe.to_mask(eachFd.lhs) for eachFd in fdSet]
+        rhsMasks = [universe.to_mask(eachFd.rhs) for eachFd in fdSet]
 
+        out = bytearray(_HEADER.pack(_MAGIC, _VERSION, _FLAG_INDEX if index else 0,
+                                     len(universe), len(lhsMasks), width))
+        for eachAttr in universe.attrs:
+            name = str(eachAttr).encode('utf-8')
+            out += struct.pack('<H', len(name)) + name
+        for mask in lhsMasks + rhsMasks:
+            out += mask.to_bytes(width, 'little')
+        if index:
+            users = [[] for _ in universe.attrs]
+            for fdNo, lhs in enumerate(lhsMasks):
+                while lhs:
+                    bit = lhs & -lhs
+                    lhs ^= bit
+                    users[bit.bit_length() - 1].append(fdNo)
+            starts = [0]
+            for fdNumbers in users:
+                starts.append(starts[-1] + len(fdNumbers))
+            out += struct.pack(f'<{len(starts)}I', *starts)
+            out += struct.pack(f'<{starts[-1]}I', *[n for each in users for n in each])
+        with open(self.path, 'wb') as f:
+            f.write(out)
@@ -1,6 +1,174 @@
-from fdsolver.classes import FD, FDSet
-from itertools import chain, combinations
+from fdsolver.classes import FD, FDSet, AttrUniverse
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from itertools import combinations, islice, repeat
 from random import shuffle 
+from time import perf_counter
+
+try:
+    import numpy as np
+except ImportError:  # optional; closure_many falls back to one closure at a time
+    np = None
+
+
+class _ClosureIndex:
+    '''
+    Counter-based closure engine (Beeri & Bernstein, 1979).
+    Every FD is indexed under each attribute of its LHS, and a closure keeps
+    a count of the LHS attributes each FD is still missing. An FD fires once
+    its count drops to zero, so a closure touches each FD at most |LHS| times
+    and runs in time linear in the size of the FD set.
+    Works purely on bitmasks (see AttrUniverse).
+
+    Methods:
+    add(lhs, rhs), remove(lhs, rhs)
+    closure(mask, skip, goal, limit)
+    '''
+
+    stats = None  # a Solver's stats dict while its instrumentation is on
+
+    def __init__(self, lhsMasks=(), rhsMasks=(), users=None):
+        self.lhs = []
+        self.rhs = []
+        self.lhsSizes = []
+        self.users = {}  # attribute bit -> indices of FDs with it on the LHS
+        self.free = []   # FDs with an empty LHS fire unconditionally
+        if users is None:
+            for lhs, rhs in zip(lhsMasks, rhsMasks):
+                self.add(lhs, rhs)
+        else:
+            # A prebuilt attribute index (e.g. loaded from a binary FD file)
+            self.lhs = list(lhsMasks)
+            self.rhs = list(rhsMasks)
+            self.lhsSizes = [lhs.bit_count() for lhs in self.lhs]
+            self.users = users
+            self.free = [index for index, lhs in enumerate(self.lhs) if lhs == 0]
+
+    def add(self, lhs, rhs):
+        self.lhs.append(lhs)
+        self.rhs.append(rhs)
+        self.lhsSizes.append(lhs.bit_count())
+        self._link(len(self.lhs) - 1)
+
+    def remove(self, lhs, rhs):
+        # The FD is found through its lowest LHS attribute, and the last FD
+        # is moved into its slot so the lists stay dense
+        candidates = self.users.get(lhs & -lhs, ()) if lhs else self.free
+        index = next(each for each in candidates
+                     if self.lhs[each] == lhs and self.rhs[each] == rhs)
+        self._unlink(index)
+        last = len(self.lhs) - 1
+        if index != last:
+            self._unlink(last)
+            self.lhs[index] = self.lhs[last]
+            self.rhs[index] = self.rhs[last]
+            self.lhsSizes[index] = self.lhsSizes[last]
+            self._link(index)
+        self.lhs.pop()
+        self.rhs.pop()
+        self.lhsSizes.pop()
+
+    def _link(self, index):
+        lhs = self.lhs[index]
+        if lhs == 0:
+            self.free.append(index)
+        while lhs:
+            lowBit = lhs & -lhs
+            lhs ^= lowBit
+            self.users.setdefault(lowBit, []).append(index)
+
+    def _unlink(self, index):
+        lhs = self.lhs[index]
+        if lhs == 0:
+            self.free.remove(index)
+        while lhs:
+            lowBit = lhs & -lhs
+            lhs ^= lowBit
+            self.users[lowBit].remove(index)
+
+    def closure(self, mask, skip=(), goal=None, limit=None):
+        # `skip` holds indices of FDs to leave out, so callers can mask FDs
+        # out without building a new index.
+        # With a `goal`, stops as soon as every goal attribute is reached
+        # (the result is then only part of the closure).
+        # With a `limit`, attributes outside of it are never derived or used
+        # to derive (those of `mask` are kept in the result, but fire nothing).
+        rhsMasks, users, lhsSizes = self.rhs, self.users, self.lhsSizes
+        closure = mask
+        for index in self.free:
+            if index not in skip:
+                closure |= rhsMasks[index] if limit is None else rhsMasks[index] & limit
+        pending = closure if limit is None else closure & limit
+        if goal is not None and goal & ~closure == 0:
+            pending = 0
+        remaining = {}  # only FDs that were touched get a counter
+        while pending:
+            lowBit = pending & -pending
+            pending ^= lowBit
+            for index in users.get(lowBit, ()):
+                left = remaining.get(index, lhsSizes[index]) - 1
+                remaining[index] = left
+                if left == 0 and index not in skip:
+                    new = rhsMasks[index] & ~closure
+                    if limit is not None:
+                        new &= limit
+                    if new:
+                        closure |= new
+                        if goal is not None and goal & ~closure == 0:
+                            pending = 0
+                            break
+                        pending |= new
+        if self.stats is not None:
+            # Counted after the fact, so closures cost nothing extra without stats
+            self.stats['closures'] += 1
+            self.stats['fd_firings'] += (
+                sum(1 for index in self.free if index not in skip)
+                + sum(1 for index, left in remaining.items() if left == 0 and index not in skip))
+        return closure
+
+
+def _masks_to_matrix(masks, width):
+    # One boolean row per mask, one column per attribute bit
+    byteCount = (width + 7) // 8
+    raw = b''.join(mask.to_bytes(byteCount, 'little') for mask in masks)
+    rows = np.frombuffer(raw, dtype=np.uint8).reshape(len(masks), byteCount)
+    return np.unpackbits(rows, axis=1, bitorder='little')[:, :width].astype(bool)
+
+
+def _matrix_to_masks(matrix):
+    packed = np.packbits(matrix, axis=1, bitorder='little')
+    return [int.from_bytes(row.tobytes(), 'little') for row in packed]
+
+
+# Closure index of a parallel key search worker, built once per process
+_workerIndex = None
+
+
+def _init_key_worker(lhsMasks, rhsMasks):
+    global _workerIndex
+    _workerIndex = _ClosureIndex(lhsMasks, rhsMasks)
+
+
+def _minimize_key_candidate(relMask, core, mask):
+    '''
+    Parallel key search worker: drops attributes from a superkey of `rel`
+    (other than the ones in `core`) until it is a key.
+    Only masks cross the process boundary; the worker has its own index.
+
+    :returns: A tuple of the key and the number of closures it took.
+    '''
+    
+    closure = _workerIndex.closure
+    optional = mask & ~core
+    closures = 0
+    while optional:
+        bit = optional & -optional
+        optional ^= bit
+        closures += 1
+        if relMask & ~closure(mask & ~bit, goal=relMask) == 0:
+            mask &= ~bit
+    return mask, closures
+
 
 # Solves based on the set of FDs given to it on initialisation
 class Solver:
@@ -12,23 +180,312 @@ class Solver:
 
     Operators:
     __str__, __repr__
+
+    Properties:
+    fdSet (built on first use for solvers made from masks)
+    completeRel (every attribute of the FD set)
     '''
 
-    def __init__(self, fdSet):
+    def __init__(self, fdSet, cache_size=1024):
         '''
         Initializes the solver based on a given FD set.
+        Every FD is encoded into bitmasks over an interned attribute universe,
+        and all solving is done on those masks internally.
+        Closures are memoized in an LRU cache. The solver subscribes to the FD set,
+        so FDs that are added, removed or replaced later are applied to the
+        index in place (on the next query), and cached closures are extended
+        or dropped only where the change reaches them.
         
         :param fdSet: All solver solutions will be based on this set (unless specified otherwise).
+        :param cache_size: How many closures to remember (0 turns the cache off).
         :returns: None
         '''
         
-        self.fdSet = fdSet
-        self.completeRel = set()
+        attrs = set()
         for eachFd in fdSet:
-            for eachRel in eachFd.lhs:
-                self.completeRel |= set(eachRel)
-            for eachRel in eachFd.rhs:
-                self.completeRel |= set(eachRel)
+            attrs |= eachFd.lhs
+            attrs |= eachFd.rhs
+        self._setup(fdSet, AttrUniverse(attrs), cache_size)
+        self._build()
+
+    @classmethod
+    def from_masks(cls, attrs, lhsMasks, rhsMasks, users=None, cache_size=1024):
+        '''
+        Builds a solver straight from FDs that are already encoded as bitmasks
+        (e.g. loaded from a binary FD file), without encoding them again.
+        No FD objects are made until the solver's fdSet is first used.
+
+        :param attrs: The attribute of each bit, in bit order.
+        :param lhsMasks: The LHS mask of each FD.
+        :param rhsMasks: The RHS mask of each FD.
+        :param users: Optional prebuilt index of attribute bit -> FDs with it on the LHS.
+        :param cache_size: How many closures to remember (0 turns the cache off).
+        :returns: The new solver.
+        '''
+        
+        universe = AttrUniverse()
+        for eachAttr in attrs:
+            universe.intern(eachAttr)
+        solver = cls.__new__(cls)
+        solver._setup(None, universe, cache_size)
+        solver._build(_ClosureIndex(lhsMasks, rhsMasks, users))
+        return solver
+
+    @property
+    def fdSet(self):
+        if self._fdSet is None:
+            # Made from masks: nothing can have changed the FDs before now,
+            # so the FD set is simply what the index holds
+            fdSet = FDSet()
+            fdSet.add_steps(FD(self._rel(lhs), self._rel(rhs))
+                            for lhs, rhs in zip(self._engine.lhs, self._engine.rhs))
+            fdSet.subscribe(self)
+            self._fdSet = fdSet
+            self._version = fdSet._version
+        return self._fdSet
+
+    @fdSet.setter
+    def fdSet(self, fdSet):
+        if self._fdSet is not None:
+            self._fdSet.unsubscribe(self)
+        self._fdSet = fdSet
+        fdSet.subscribe(self)
+        self._build()
+
+    def _setup(self, fdSet, universe, cache_size):
+        self._fdSet = fdSet  # None until needed for solvers made from masks
+        self._universe = universe
+        self._cache = OrderedDict()
+        self._cacheSize = cache_size
+        self._cacheHits = 0
+        self._cacheMisses = 0
+        self._stats = None  # counters, only while instrumentation is on
+        self._pending = []  # (fd, added) changes to the FD set not applied yet
+        if fdSet is not None:
+            fdSet.subscribe(self)
+
+    def _build(self, engine=None):
+        # (Re)indexes the FD set and forgets every cached closure
+        if self._stats is not None:
+            self._stats['index_builds'] += 1
+        if engine is None:
+            engine = _ClosureIndex()
+            for eachFd in self.fdSet:
+                engine.add(self._mask(eachFd.lhs), self._mask(eachFd.rhs))
+        engine.stats = self._stats
+        self._engine = engine
+        self._scan_masks()
+        self._cache.clear()
+        self._projections = {}  # rel mask -> minimal cover of the projection
+        self._matrices = None    # LHS/RHS boolean matrices for closure_many
+        self._pending.clear()
+        self._version = None if self._fdSet is None else self._fdSet._version
+
+    def _scan_masks(self):
+        engine = self._engine
+        self._lhsAll = 0  # every attribute that appears on some LHS
+        self._rhsAll = 0  # every attribute that appears on some RHS
+        self._fullMask = 0
+        for lhsMask, rhsMask in zip(engine.lhs, engine.rhs):
+            self._lhsAll |= lhsMask
+            self._rhsAll |= rhsMask & ~lhsMask
+            self._fullMask |= lhsMask | rhsMask
+        self._completeRel = self._rel(self._fullMask)
+
+    def _fd_changed(self, fd, added):
+        # Called by the FD set; changes are queued and applied on the next query
+        self._pending.append((fd, added))
+
+    def _sync(self):
+        if self._fdSet is not None and self._version != self._fdSet._version:
+            if self._pending:
+                self._apply_pending()
+            else:
+                self._build()
+
+    def _apply_pending(self):
+        '''
+        Applies queued FD set changes to the index in place.
+        A cached closure stays valid when a removed FD never fired in it (its
+        LHS is not contained in the closure). Otherwise it is dropped. A
+        closure that an added FD can fire in is extended: closing it again
+        under the new index starts from the old closure.
+        '''
+        
+        engine = self._engine
+        added, removed = set(), set()
+        for fd, isAdded in self._pending:
+            masks = (self._mask(fd.lhs), self._mask(fd.rhs))
+            if isAdded:
+                engine.add(*masks)
+                if masks in removed:
+                    removed.discard(masks)  # back to how it was
+                else:
+                    added.add(masks)
+            else:
+                engine.remove(*masks)
+                if masks in added:
+                    added.discard(masks)
+                else:
+                    removed.add(masks)
+        self._pending.clear()
+
+        if removed:
+            self._scan_masks()
+        else:
+            fullMask = self._fullMask
+            for lhs, rhs in added:
+                self._lhsAll |= lhs
+                self._rhsAll |= rhs & ~lhs
+                self._fullMask |= lhs | rhs
+            if self._fullMask != fullMask:
+                self._completeRel = self._rel(self._fullMask)
+
+        cache = self._cache
+        for mask, closure in list(cache.items()):
+            if any(lhs & ~closure == 0 for lhs, rhs in removed):
+                del cache[mask]
+            elif any(lhs & ~closure == 0 and rhs & ~closure for lhs, rhs in added):
+                cache[mask] = engine.closure(closure)
+        self._projections = {}
+        self._matrices = None
+        self._version = self.fdSet._version
+
+    @property
+    def _index(self):
+        self._sync()
+        return self._engine
+
+    @property
+    def completeRel(self):
+        self._sync()
+        return self._completeRel
+
+    def _closure_mask(self, mask, goal=None):
+        '''
+        Closure of a mask, going through the LRU cache.
+        Goal-directed closures that stop early are not cached, since they
+        are only part of the closure; when the goal is missed the fixpoint
+        was reached, so that result is cached like any other.
+        '''
+        
+        index = self._index
+        cache = self._cache
+        closure = cache.get(mask)
+        if closure is not None:
+            self._cacheHits += 1
+            cache.move_to_end(mask)
+            return closure
+        self._cacheMisses += 1
+        closure = index.closure(mask, goal=goal)
+        if self._cacheSize > 0 and (goal is None or goal & ~closure):
+            cache[mask] = closure
+            if len(cache) > self._cacheSize:
+                cache.popitem(last=False)
+        return closure
+
+    def cache_info(self):
+        '''
+        Returns statistics about the closure cache.
+
+        :returns: A dict with hits, misses, size and maxsize.
+        '''
+        self._sync()
+        return {'hits': self._cacheHits, 'misses': self._cacheMisses,
+                'size': len(self._cache), 'maxsize': self._cacheSize}
+
+    def clear_cache(self):
+        '''
+        Forgets every cached closure and resets the cache statistics.
+
+        :returns: None
+        '''
+        self._cache.clear()
+        self._cacheHits = 0
+        self._cacheMisses = 0
+
+    # Public methods that are timed while instrumentation is on.
+    # Generators (iter_*) are left out, since calling them does no work.
+    _timedMethods = ('closure', 'closure_many', 'implies', 'subsets', 'superkeys',
+                     'keys', 'search_keys', 'prime_attrs', 'is_prime', 'is_superkey',
+                     'is_key', 'find_bcnf_violation', 'is_bcnf', 'find_bcnf_decomp',
+                     'is_dependency_preserving', 'is_lossless_decomp', 'is_lossless',
+                     'find_3nf_violation', 'is_3nf', 'find_3nf_synthesis',
+                     'find_minimal_basis', 'covers', 'equivalent', 'canonical_basis',
+                     'canonical_form', 'project')
+
+    def enable_stats(self, enabled=True):
+        '''
+        Turns instrumentation on (or off) for this solver.
+        While it is on, the solver counts closures computed, FDs fired, vectorized
+        closure passes, subsets generated and closure indexes built, and times
+        every public method. While it is off, none of this costs anything:
+        the timers are wrappers set on the instance, and the counters are only
+        touched once per closure behind a single None check.
+        Parallel key search workers only report how many closures they ran.
+
+        :param enabled: Whether to turn instrumentation on.
+        :returns: None
+        '''
+        
+        if enabled == (self._stats is not None):
+            return
+        if not enabled:
+            self._stats = None
+            self._engine.stats = None
+            for name in self._timedMethods:
+                del self.__dict__[name]
+            return
+        self._stats = {'closures': 0, 'fd_firings': 0, 'passes': 0,
+                       'subsets': 0, 'index_builds': 0, 'methods': {}}
+        self._engine.stats = self._stats
+        for name in self._timedMethods:
+            setattr(self, name, self._timed(name, getattr(self, name)))
+
+    def _timed(self, name, method):
+        stats = self._stats
+        def timed(*args, **kwargs):
+            start = perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                entry = stats['methods'].setdefault(name, {'calls': 0, 'seconds': 0.0})
+                entry['calls'] += 1
+                entry['seconds'] += perf_counter() - start
+        return timed
+
+    def stats(self):
+        '''
+        Returns the instrumentation counters as a plain dict, ready to be
+        exported: closures, fd_firings, passes, subsets, index_builds,
+        cache_hits, cache_misses, and methods (name -> calls and total seconds,
+        where nested calls count towards every method they run under).
+
+        :returns: A dict, or None if instrumentation is off.
+        '''
+        
+        if self._stats is None:
+            return None
+        result = {key: value for key, value in self._stats.items() if key != 'methods'}
+        result['cache_hits'] = self._cacheHits
+        result['cache_misses'] = self._cacheMisses
+        result['methods'] = {name: dict(entry) for name, entry in self._stats['methods'].items()}
+        return result
+
+    def reset_stats(self):
+        '''
+        Zeroes every instrumentation counter (and the cache statistics).
+
+        :returns: None
+        '''
+        
+        if self._stats is not None:
+            for key in self._stats:
+                if key != 'methods':
+                    self._stats[key] = 0
+            self._stats['methods'].clear()
+        self._cacheHits = 0
+        self._cacheMisses = 0
 
     def __str__(self):
         return str(self.fdSet)
@@ -36,6 +493,123 @@ class Solver:
     def __repr__(self):
         return self.fdSet
 
+    def _mask(self, rel):
+        return self._universe.to_mask(rel)
+
+    def _rel(self, mask):
+        return self._universe.to_rel(mask)
+
+    def _rel_mask(self, rel):
+        # Mask of `rel`, defaulting to every attribute of the FD set
+        self._sync()
+        if rel == None:
+            return self._fullMask
+        return self._mask(rel)
+
+    def _iter_subset_masks(self, mask):
+        # Lazily yields every non-empty subset of `mask`, smallest first
+        subsets = self._subset_masks(mask)
+        if self._stats is None:
+            return subsets
+        return self._counted_subsets(subsets)
+
+    def _counted_subsets(self, subsets):
+        stats = self._stats
+        for each in subsets:
+            stats['subsets'] += 1
+            yield each
+
+    def _subset_masks(self, mask):
+        bits = []
+        while mask:
+            lowBit = mask & -mask
+            bits.append(lowBit)
+            mask ^= lowBit
+        for size in range(1, len(bits)+1):
+            for combo in combinations(bits, size):
+                yield sum(combo)
+
+    def iter_subsets(self, rel):
+        '''
+        Lazily yields the non-empty subsets of the given set, smallest first.
+        Only one subset is alive at a time, so callers can stop early for free.
+
+        :param rel: The set to find the subsets of.
+        :returns: A generator of sets.
+        '''
+        for each in self._iter_subset_masks(self._mask(rel)):
+            yield self._rel(each)
+
+    _batchSize = 4096        # most queries per vectorized closure batch
+    _batchMemory = 64 << 20  # rough cap on the bytes of NumPy arrays a batch takes
+
+    def _vectorized(self):
+        # Whether closure batches go through NumPy: the FD matrices take
+        # two float32 entries per FD and attribute, and must fit the cap
+        fdCount = len(self._index.lhs)
+        return (np is not None and fdCount > 0
+                and 8 * fdCount * max(len(self._universe), 1) <= self._batchMemory)
+
+    def _batch_size(self):
+        # Each query takes a few float32 rows per batch: one entry per FD
+        # (the FDs that fired) and one per attribute (the query itself)
+        rowBytes = 8 * (len(self._index.lhs) + max(len(self._universe), 1))
+        return max(1, min(self._batchSize, self._batchMemory // rowBytes))
+
+    def closure_many(self, rels, goal=None):
+        '''
+        Returns the closures of many relations at once.
+        With NumPy installed, the FD set is encoded as LHS/RHS boolean matrices and
+        the whole batch iterates to its fixpoint with vectorized operations;
+        without it, or when those matrices would be too big, the closures are
+        computed one at a time. Batches are sized to keep their memory bounded.
+
+        :param rels: The relations to find the closures of.
+        :param goal: If given, return whether each closure contains `goal` instead
+                     (e.g. pass the relation itself to get superkey flags).
+        :returns: A list of relations, or a list of booleans if `goal` is given.
+        '''
+        
+        masks = [self._mask(each) for each in rels]
+        goalMask = None if goal == None else self._mask(goal)
+        results = []
+        batchSize = self._batch_size()
+        for start in range(0, len(masks), batchSize):
+            results += self._closure_many_masks(masks[start:start+batchSize], goalMask)
+        if goalMask is not None:
+            return results
+        return [self._rel(each) for each in results]
+
+    def _closure_many_masks(self, masks, goal=None):
+        if not self._vectorized():
+            if goal is None:
+                return [self._closure_mask(each) for each in masks]
+            return [self._determines(each, goal) for each in masks]
+
+        width = max(len(self._universe), 1)
+        if self._matrices is None or self._matrices[0].shape[0] != width:
+            lhsMatrix = _masks_to_matrix(self._index.lhs, width)
+            rhsMatrix = _masks_to_matrix(self._index.rhs, width)
+            self._matrices = (lhsMatrix.T.astype(np.float32),
+                              rhsMatrix.astype(np.float32),
+                              lhsMatrix.sum(axis=1))
+        lhsT, rhs, lhsSizes = self._matrices
+
+        queries = _masks_to_matrix(masks, width)
+        while True:
+            # An FD fires for a query once the query holds its whole LHS
+            fired = (queries.astype(np.float32) @ lhsT) >= lhsSizes
+            derived = queries | ((fired.astype(np.float32) @ rhs) > 0)
+            if self._stats is not None:
+                self._stats['passes'] += 1
+            if np.array_equal(derived, queries):
+                break
+            queries = derived
+        if goal is not None:
+            goalRow = _masks_to_matrix([goal], width)[0]
+            return (queries[:, goalRow].all(axis=1)).tolist()
+        return _matrix_to_masks(queries)
+
     def subsets(self, rel):
         '''
         Returns all the subsets of the given set in a list.
@@ -43,18 +617,7 @@ class Solver:
         :param rel: The set to find the subsets of.
         :returns: A list of sets.
         '''
-        lst = [set(item) for item in rel]
-        allSubsets = list(chain.from_iterable( \
-                            combinations(lst, r) for r in range(len(lst)+1)))
-        unionedSubsets = []
-        for eachSubset in allSubsets:
-            if len(eachSubset) == 0:
-                continue
-            currRel = set(eachSubset[0])  # Make a copy
-            for eachRel in eachSubset[1:]:
-                currRel |= set(eachRel)
-            unionedSubsets.append(currRel)
-        return unionedSubsets
+        return list(self.iter_subsets(rel))
 
     def implies(self, fd):
         '''
@@ -64,16 +627,56 @@ class Solver:
         :returns: A boolean.
         '''
         
-        return fd.rhs.issubset(self.closure(fd.lhs))
+        return self._determines(self._mask(fd.lhs), self._mask(fd.rhs))
+
+    def covers(self, other):
+        '''
+        Checks whether the solver's FD set covers another one, i.e. implies
+        every FD in it. FDs that share a LHS are checked with a single
+        goal-directed closure, and the check stops at the first FD that
+        is not implied.
 
-    def closure(self, rel=None, limit_to=None):
+        :param other: A FD set, or a Solver of one.
+        :returns: A boolean.
+        '''
+        
+        if isinstance(other, Solver):
+            other = other.fdSet
+        goals = {}  # LHS mask -> union of the RHS masks
+        for eachFd in other:
+            lhs = self._mask(eachFd.lhs)
+            goals[lhs] = goals.get(lhs, 0) | self._mask(eachFd.rhs)
+        return all(self._determines(lhs, rhs) for lhs, rhs in goals.items())
+
+    def equivalent(self, other):
+        '''
+        Checks whether the solver's FD set and another one imply the same FDs,
+        e.g. {A -> B, A -> C} and {A -> BC}. Each side keeps its own index
+        (pass a Solver to reuse one).
+
+        :param other: A FD set, or a Solver of one.
+        :returns: A boolean.
+        '''
+        
+        if not isinstance(other, Solver):
+            other = Solver(other)
+        return self.covers(other) and other.covers(self)
+
+    def _determines(self, mask, targetMask):
+        # Goal-directed closure: stops as soon as the whole target is reached
+        return targetMask & ~self._closure_mask(mask, goal=targetMask) == 0
+
+    def closure(self, rel=None, limit_to=None, goal=None):
         '''
         Returns the closure of `rel` on the solver's FD set in one relation.
-        Can be limited to a set of elements (specified together in one relation).
+        Can be limited to a set of elements (specified together in one relation),
+        in which case nothing outside of `limit_to` is derived or used to derive.
         Will include 'trivial' relations in the output!
         
         :param rel: The relation to find the closure of.
         :param limit_to: The relation to limit the closure's relations to.
+        :param goal: If given, stop as soon as the closure contains `goal`
+                     (the result is then only part of the closure).
         :returns: The relation representing the closure.
         '''
         
@@ -81,76 +684,485 @@ class Solver:
             rel = set(self.completeRel)  # Make a copy
         if len(rel) == 0:
             return rel
-        closure = set(rel)  # Make a copy again... just to be safe
-        stillValid = True
-        while stillValid:
-            stillValid = False
-            for fd in self.fdSet:
-                if fd.lhs.issubset(closure) and not fd.rhs.issubset(closure):
-                    stillValid = True
-                    closure |= fd.rhs
-        return closure 
-
-    def superkeys(self, rel=None):
+        limitMask = None if limit_to == None else self._mask(limit_to)
+        goalMask = None if goal == None else self._mask(goal)
+        if limitMask is not None:
+            return self._rel(self._index.closure(self._mask(rel), goal=goalMask, limit=limitMask))
+        return self._rel(self._closure_mask(self._mask(rel), goal=goalMask))
+
+    def superkeys(self, rel=None, workers=None):
         '''
         Returns the superkeys of the given relation on the solver's FD set.
+        With `workers`, the keys are found in parallel (see keys()) and the
+        superkeys are generated as their supersets, without any closures.
 
         :param rel: The relation to find the superkeys of.
+        :param workers: Number of worker processes to use, if any.
         :returns: A list of relations representing each of the superkeys.
         '''
         
-        if rel == None:
-            rel = set(self.completeRel)
-        superkeys = []
-        for eachSubset in self.subsets(rel):
-            if len(eachSubset) > 0 and rel.issubset(self.closure(eachSubset)):
-                superkeys.append(eachSubset)
-        return superkeys
+        relMask = self._rel_mask(rel)
+        if workers is None:
+            if not self._vectorized():
+                return list(self.iter_superkeys(rel))
+            # Check the subsets in vectorized batches
+            superkeys = []
+            subsets = self._iter_subset_masks(relMask)
+            batchSize = self._batch_size()
+            batch = list(islice(subsets, batchSize))
+            while batch:
+                flags = self._closure_many_masks(batch, goal=relMask)
+                superkeys += [self._rel(each) for each, flag in zip(batch, flags) if flag]
+                batch = list(islice(subsets, batchSize))
+            return superkeys
+        superkeys = set()
+        for key in self._parallel_key_masks(relMask, workers):
+            superkeys.add(key)
+            for extra in self._iter_subset_masks(relMask & ~key):
+                superkeys.add(key | extra)
+        ordered = sorted(superkeys, key=lambda mask: (mask.bit_count(), mask))
+        return [self._rel(each) for each in ordered]
 
-    def keys(self, rel=None):
+    def iter_superkeys(self, rel=None):
+        '''
+        Lazily yields the superkeys of the given relation, smallest first.
+
+        :param rel: The relation to find the superkeys of.
+        :returns: A generator of relations.
+        '''
+        
+        relMask = self._rel_mask(rel)
+        for each in self._iter_subset_masks(relMask):
+            if self._determines(each, relMask):
+                yield self._rel(each)
+
+    def keys(self, rel=None, workers=None):
         '''
         Returns the keys of the given relation on the solver's FD set.
+        Keys are found with the Lucchesi-Osborn algorithm, so the cost grows with
+        the number of keys rather than with the number of subsets of `rel`.
+        With `workers`, the superkeys each round of the search has to minimize
+        are spread over a process pool.
 
         :param rel: The relation to find the keys of.
-        :returns: A list of relations representing each of the keys.
+        :param workers: Number of worker processes to use, if any.
+        :returns: A list of relations representing each of the keys, smallest first.
         '''
         
-        if rel == None:
-            rel = set(self.completeRel)
-        superkeys = self.superkeys(rel)
-        keys = []
-        for i in range(len(superkeys)):
-            sub = False
-            for j in range(len(superkeys)):
-                if (i != j and superkeys[j].issubset(superkeys[i]) \
-                           and superkeys[i] != superkeys[j]):
-                    sub = True
-                    break
-            if not sub:
-                keys.append(superkeys[i])
+        relMask = self._rel_mask(rel)
+        if workers is None:
+            keyMasks = self._key_masks(relMask)
+        else:
+            keyMasks = self._parallel_key_masks(relMask, workers)
+        keys = [self._rel(each) for each in keyMasks]
+        return sorted(keys, key=lambda key: (len(key), sorted(key)))
+
+    _parallelMinimum = 16  # candidates a round needs before it goes to the pool
+
+    def _parallel_key_masks(self, relMask, workers):
+        '''
+        Lucchesi-Osborn (see _iter_lucchesi_osborn_keys), run in rounds: every
+        key found in a round is combined with every FD, and the superkeys that
+        hold no known key are minimized in parallel by worker processes.
+        This does the same work as the sequential search, give or take the
+        duplicates of a round, so workers never make the search asymptotically
+        slower. Rounds with only a few candidates are minimized locally, and
+        the pool is only started once a round is big enough.
+        '''
+        
+        if relMask == 0:
+            return []
+        core, never = self._key_bounds(relMask)
+        fds = self._lucchesi_osborn_fds(relMask, never)
+        keys = [self._minimize_superkey(relMask & ~never, relMask, core)]
+        frontier = keys[:]
+        pool = None
+        try:
+            while frontier:
+                candidates = {}  # dict keeps the order and drops duplicates
+                for key in frontier:
+                    for lhs, rhs in fds:
+                        if rhs & key == 0:
+                            continue
+                        candidate = (lhs | (key & ~rhs)) & ~never
+                        if not any(other & ~candidate == 0 for other in keys):
+                            candidates[candidate] = None
+                if len(candidates) < self._parallelMinimum:
+                    found = [self._minimize_superkey(each, relMask, core) for each in candidates]
+                else:
+                    if pool is None:
+                        index = self._index
+                        pool = ProcessPoolExecutor(max_workers=workers,
+                                                   initializer=_init_key_worker,
+                                                   initargs=(index.lhs, index.rhs))
+                    found = []
+                    for key, closures in pool.map(_minimize_key_candidate, repeat(relMask),
+                                                  repeat(core), candidates,
+                                                  chunksize=max(1, len(candidates) // (4 * workers))):
+                        found.append(key)
+                        if self._stats is not None:
+                            self._stats['closures'] += closures
+                # Candidates hold no known key, so neither do their keys
+                frontier = list(dict.fromkeys(found))
+                keys += frontier
+        finally:
+            if pool is not None:
+                pool.shutdown()
         return keys
 
+    def iter_keys(self, rel=None, max_keys=None, timeout=None, max_closures=None):
+        '''
+        Lazily yields the keys of the given relation, in the order the
+        Lucchesi-Osborn search (see keys()) finds them, which is not by size,
+        so the first keys come out without enumerating the rest.
+        The search stops quietly once any budget runs out; use search_keys()
+        to also learn whether every key was found.
+
+        :param rel: The relation to find the keys of.
+        :param max_keys: Stop after this many keys.
+        :param timeout: Stop after this many seconds.
+        :param max_closures: Stop after this many closures.
+        :returns: A generator of relations.
+        '''
+        
+        relMask = self._rel_mask(rel)
+        budget = self._key_budget(max_keys, timeout, max_closures)
+        for each in self._iter_key_masks(relMask, budget):
+            yield self._rel(each)
+
+    def search_keys(self, rel=None, max_keys=None, timeout=None, max_closures=None):
+        '''
+        Finds the keys of the given relation within a budget.
+        Whatever was found when a budget runs out is returned, so a partial
+        answer is always delivered on time. Keys are found in no particular
+        order, so a partial answer holds an arbitrary subset of the keys (not
+        necessarily the smallest ones); the list is only sorted by size. The search is the same as keys(),
+        so the answer is complete as soon as keys() would have finished.
+        Budgets are checked before every superkey is minimized and, for a
+        sub-relation, before every closure that projects the FD set onto it,
+        so the timeout is overshot by at most one minimization.
+
+        :param rel: The relation to find the keys of.
+        :param max_keys: Stop after this many keys.
+        :param timeout: Stop after this many seconds.
+        :param max_closures: Stop after this many closures (cache hits are free).
+        :returns: A dict with keys (a list of relations), complete (whether those
+                  are all the keys), stopped_by (the budget that ran out:
+                  'max_keys', 'timeout', 'max_closures', or None) and closures.
+        '''
+        
+        relMask = self._rel_mask(rel)
+        budget = self._key_budget(max_keys, timeout, max_closures)
+        keys = [self._rel(each) for each in self._iter_key_masks(relMask, budget)]
+        keys.sort(key=lambda key: (len(key), sorted(key)))
+        return {'keys': keys, 'complete': budget['stopped_by'] is None,
+                'stopped_by': budget['stopped_by'], 'closures': self._closures_since(budget)}
+
+    def _key_budget(self, max_keys, timeout, max_closures):
+        return {'max_keys': max_keys, 'max_closures': max_closures,
+                'deadline': None if timeout is None else perf_counter() + timeout,
+                'start': self._cacheMisses, 'stopped_by': None}
+
+    def _closures_since(self, budget):
+        # Every closure the index computes is a cache miss; hits cost nothing
+        return self._cacheMisses - budget['start']
+
+    def _out_of_budget(self, budget, keyCount):
+        if budget['max_keys'] is not None and keyCount >= budget['max_keys']:
+            budget['stopped_by'] = 'max_keys'
+        elif (budget['max_closures'] is not None
+              and self._closures_since(budget) >= budget['max_closures']):
+            budget['stopped_by'] = 'max_closures'
+        elif budget['deadline'] is not None and perf_counter() >= budget['deadline']:
+            budget['stopped_by'] = 'timeout'
+        return budget['stopped_by'] is not None
+
+    def _key_masks(self, relMask):
+        return list(self._iter_key_masks(relMask))
+
+    def _iter_key_masks(self, relMask, budget=None):
+        if relMask == 0:
+            return iter(())
+        return self._iter_lucchesi_osborn_keys(relMask, budget)
+
+    def _lucchesi_osborn_fds(self, relMask, never, budget=None):
+        # The FDs that can lead from one key to another: the FD set itself if
+        # `rel` covers it, or else its (cached) projection onto `rel`.
+        # None if the budget runs out while projecting.
+        if relMask & self._fullMask == self._fullMask:
+            fdMasks = zip(self._index.lhs, self._index.rhs)
+        else:
+            fdMasks = self._project_masks(relMask, budget)
+            if fdMasks is None:
+                return None
+        fds = set()
+        for lhs, rhs in fdMasks:
+            if rhs & ~lhs & ~never:
+                fds.add((lhs, rhs & ~lhs))
+        return fds
+
+    def _key_bounds(self, relMask):
+        '''
+        Splits `rel` into the attributes that are in every key (core)
+        and the ones that are in no key at all (never).
+        An attribute is in every key iff it is not determined by the rest of `rel`,
+        and an attribute that never appears on a LHS is in no key iff it is.
+        Both reduce to the usual rules (never on a RHS / only on a RHS)
+        when `rel` covers the whole FD set.
+        '''
+        
+        if relMask & self._fullMask == self._fullMask:
+            core = relMask & ~self._rhsAll
+            return core, relMask & self._rhsAll & ~self._lhsAll
+        core, never = relMask & ~self._rhsAll, 0
+        remaining = relMask & self._rhsAll
+        while remaining:
+            bit = remaining & -remaining
+            remaining ^= bit
+            if not self._determines(relMask & ~bit, bit):
+                core |= bit
+            elif bit & self._lhsAll == 0:
+                never |= bit
+        return core, never
+
+    def _minimize_superkey(self, mask, relMask, core):
+        # Drops attributes from a superkey until it is a key
+        optional = mask & ~core
+        while optional:
+            bit = optional & -optional
+            optional ^= bit
+            if self._determines(mask & ~bit, relMask):
+                mask &= ~bit
+        return mask
+
+    def _iter_lucchesi_osborn_keys(self, relMask, budget=None):
+        '''
+        Lucchesi-Osborn key enumeration over FDs that lie inside `rel`
+        (see _lucchesi_osborn_fds).
+        For every key K and FD X -> Y, X | (K - Y) is a superkey, and every
+        key is reached by minimizing such a superkey that contains no known key.
+        Keys are yielded as they are found, so callers can stop early; the
+        first one only takes closures on the FD set, so it comes out before
+        the FDs are projected onto `rel`.
+        With a budget (see _key_budget), stops before the first minimization
+        that would go over it, or as soon as it runs out while projecting,
+        and records which limit ran out.
+        '''
+        
+        if budget is not None and self._out_of_budget(budget, 0):
+            return
+        core, never = self._key_bounds(relMask)
+        keys = [self._minimize_superkey(relMask & ~never, relMask, core)]
+        yield keys[0]
+        if keys[0] == core:
+            return  # the attributes in every key form a key, so it is the only one
+        if budget is not None and self._out_of_budget(budget, len(keys)):
+            return
+        fds = self._lucchesi_osborn_fds(relMask, never, budget)
+        if fds is None:
+            return
+        index = 0
+        while index < len(keys):
+            key = keys[index]
+            index += 1
+            for lhs, rhs in fds:
+                if rhs & key == 0:
+                    continue
+                candidate = (lhs | (key & ~rhs)) & ~never
+                if any(other & ~candidate == 0 for other in keys):
+                    continue
+                if budget is not None and self._out_of_budget(budget, len(keys)):
+                    return
+                keys.append(self._minimize_superkey(candidate, relMask, core))
+                yield keys[-1]
+
+    def _iter_prime_masks(self, relMask):
+        '''
+        Lazily sorts the attributes of `rel` into prime and non-prime ones.
+        Yields (prime, unknown) masks, where every attribute outside both is
+        known to be non-prime. Attributes in every key (e.g. never on a RHS)
+        and attributes in no key are settled before any key is enumerated;
+        after that, each new key settles its own attributes, and the search
+        stops once nothing is unknown. The last pair has no unknown attributes.
+        '''
+        
+        core, never = self._key_bounds(relMask)
+        prime, unknown = core, relMask & ~core & ~never
+        yield prime, unknown
+        if unknown:
+            for key in self._iter_key_masks(relMask):
+                if key & unknown:
+                    prime |= key
+                    unknown &= ~key
+                    yield prime, unknown
+                    if not unknown:
+                        return
+            yield prime, 0
+
     def prime_attrs(self, rel=None):
         '''
-        Returns the prime attributes of the given relatio non the solver's FD set.
+        Returns the prime attributes of the given relation on the solver's FD set.
+        Keys are only enumerated until every attribute is known to be prime or not.
 
         :param rel: The relation to find the prime attributes of.
         :returns: A relation with each of the prime attributes.
         '''
         
-        if rel == None:
-            rel = set(self.completeRel)
-        keys = self.keys(rel)
-        if len(keys) == 0:
+        relMask = self._rel_mask(rel)
+        if relMask == 0:
             return None
+        for prime, unknown in self._iter_prime_masks(relMask):
+            pass
+        return self._rel(prime)
 
-        prime_attrs = set(keys[0])
-        if len(keys) == 1:
-            return prime_attrs
+    def is_prime(self, attr, rel=None):
+        '''
+        Checks whether an attribute is in some key of the given relation.
+        Stops at the first key that contains it.
+
+        :param attr: The attribute to check.
+        :param rel: The relation the attribute belongs to.
+        :returns: A boolean.
+        '''
         
-        for key in keys[1:]:
-            prime_attrs |= key
-        return prime_attrs
+        relMask = self._rel_mask(rel)
+        bit = self._universe.bits.get(attr, 0) & relMask
+        if bit == 0:
+            return False
+        for prime, unknown in self._iter_prime_masks(relMask):
+            if bit & prime:
+                return True
+            if bit & unknown == 0:
+                return False
+
+    def is_superkey(self, attrs, rel=None):
+        '''
+        Checks whether a set of attributes is a superkey of the given relation,
+        with a single closure that stops as soon as the relation is reached.
+
+        :param attrs: The attributes to check.
+        :param rel: The relation they should determine.
+        :returns: A boolean.
+        '''
+        
+        relMask = self._rel_mask(rel)
+        mask = self._mask(attrs)
+        return mask & ~relMask == 0 and self._determines(mask, relMask)
+
+    def is_key(self, attrs, rel=None):
+        '''
+        Checks whether a set of attributes is a key of the given relation,
+        i.e. a superkey that stops being one when any attribute is dropped.
+
+        :param attrs: The attributes to check.
+        :param rel: The relation they should determine.
+        :returns: A boolean.
+        '''
+        
+        if not self.is_superkey(attrs, rel):
+            return False
+        relMask = self._rel_mask(rel)
+        mask = self._mask(attrs)
+        remaining = mask
+        while remaining:
+            bit = remaining & -remaining
+            remaining ^= bit
+            if self._determines(mask & ~bit, relMask):
+                return False
+        return True
+
+    def _violating_closure(self, subsetMask, relMask):
+        # Closure of a subset within `rel`, or None if it does not
+        # witness a BCNF violation (i.e. it is trivial or a superkey)
+        cl = self._closure_mask(subsetMask) & relMask
+        if cl != subsetMask and cl != relMask:
+            return cl
+        return None
+
+    def _iter_violations(self, relMask):
+        '''
+        Lazily yields (subset, closure within `rel`) for subsets of a
+        sub-relation that witness a BCNF violation.
+        LHS-derived candidates are tried first. Then every pair A, B is checked
+        for A in (rel - AB)+; if no pair qualifies, `rel` is in BCNF and the
+        search stops (Tsou & Fischer). Only if that is inconclusive are the
+        subsets searched exhaustively, skipping supersets of superkeys.
+        '''
+        
+        closure = self._closure_mask
+        for lhs in self._index.lhs:
+            if lhs and lhs & ~relMask == 0:
+                cl = self._violating_closure(lhs, relMask)
+                if cl is not None:
+                    yield lhs, cl
+
+        inconclusive = False
+        for bitA, bitB, cl in self._iter_determined_pairs(relMask):
+            if cl & bitB == 0:
+                yield relMask & ~bitA & ~bitB, cl
+            inconclusive = True
+        if not inconclusive:
+            return
+
+        superkeys = []
+        for subset in self._iter_subset_masks(relMask):
+            if any(key & ~subset == 0 for key in superkeys):
+                continue
+            cl = closure(subset) & relMask
+            if cl == relMask:
+                superkeys.append(subset)
+            elif cl != subset:
+                yield subset, cl
+
+    def _bcnf_violation_masks(self, relMask):
+        if relMask & self._fullMask == self._fullMask:
+            # Every FD lies inside `rel`, so checking the FDs themselves is enough
+            for lhs, rhs in zip(self._index.lhs, self._index.rhs):
+                if rhs & ~lhs and not self._determines(lhs, relMask):
+                    return lhs, rhs & ~lhs
+            return None
+        for subset, cl in self._iter_violations(relMask):
+            return subset, cl & ~subset
+        return None
+
+    def _3nf_violation_masks(self, relMask):
+        primes = None
+        if relMask & self._fullMask == self._fullMask:
+            violations = ((lhs, rhs & ~lhs) for lhs, rhs
+                          in zip(self._index.lhs, self._index.rhs)
+                          if rhs & ~lhs and not self._determines(lhs, relMask))
+        else:
+            violations = ((subset, cl & ~subset) for subset, cl
+                          in self._iter_violations(relMask))
+        for lhs, rhs in violations:
+            if primes is None:  # keys are only needed once something is found
+                primes = self._iter_prime_masks(relMask)
+                prime, unknown = next(primes)
+            # Enumerate keys only until the RHS is settled (all of it, once
+            # a non-prime attribute shows up, so the witness is complete)
+            while rhs & unknown and not rhs & ~prime & ~unknown:
+                prime, unknown = next(primes)
+            if rhs & ~prime & ~unknown:
+                while rhs & unknown:
+                    prime, unknown = next(primes)
+                return lhs, rhs & ~prime
+        return None
+
+    def find_bcnf_violation(self, rel=None):
+        '''
+        Finds an FD that stops a relation from being in BCNF.
+        If `rel` covers every attribute of the solver's FD set, only the FDs in
+        the set have to be checked, which takes polynomial time.
+        Sub-relations go through a pruned search (see _iter_violations).
+
+        :param rel: The relation to check.
+        :returns: A violating FD X -> Y (X is not a superkey), or None.
+        '''
+        
+        violation = self._bcnf_violation_masks(self._rel_mask(rel))
+        if violation is None:
+            return None
+        return FD(self._rel(violation[0]), self._rel(violation[1]))
 
     def is_bcnf(self, rel=None):
         '''
@@ -159,19 +1171,13 @@ class Solver:
         >> subset is strict subset of subset's closure
         >> AND subset's closure is strict subset of original relation
         If so, then the relation is NOT in BCNF.
+        See find_bcnf_violation() for how the subsets are searched.
 
         :param rel: The relation to check.
         :returns: A boolean.
         '''
         
-        if rel == None:
-            rel = set(self.completeRel)
-        for subset in self.subsets(rel):
-            if len(subset) > 0:
-                cl = self.closure(subset) & rel
-                if subset.issubset(cl) and subset != cl and cl.issubset(rel) and cl != rel:
-                    return False
-        return True
+        return self._bcnf_violation_masks(self._rel_mask(rel)) is None
 
     def interactive_find_bcnf_decomp(self, rel=None):
         '''
@@ -224,60 +1230,136 @@ class Solver:
         '''
         
         decomp_list = []
-        sortedSubsetList = sorted(self.subsets(rel))
-        for subset in sortedSubsetList:
-            if len(subset) > 0:
-                cl = self.closure(subset) & rel
-                if subset.issubset(cl) and subset != cl and cl.issubset(rel) and cl != rel:
-                    r1 = cl
-                    r2 = subset | (rel - cl)
-                    decomp_list.append([r1, self.is_bcnf(r1), \
-                                        r2, self.is_bcnf(r2), \
-                                        self.is_dependency_preserving(r1,r2)])
+        relMask = self._mask(rel)
+        for subset in self._iter_subset_masks(relMask):
+            cl = self._violating_closure(subset, relMask)
+            if cl is not None:
+                r1 = self._rel(cl)
+                r2 = self._rel(subset | (relMask & ~cl))
+                decomp_list.append([r1, self.is_bcnf(r1), \
+                                    r2, self.is_bcnf(r2), \
+                                    self.is_dependency_preserving(r1,r2)])
         return decomp_list
 
-    def find_bcnf_decomp(self, rel, randomize=False):
+    def find_bcnf_decomp(self, rel, randomize=False, polynomial=False):
         '''
         Finds the BCNF decomposition of any relation on the solver's FD set.
         Since the optimal decomposition is unknown, there is a `randomize` param
         to shuffle the subsets and get a different decomposition as output.
+        The default search looks through the subsets of every fragment, which is
+        exponential; `polynomial` switches to the Tsou-Fischer algorithm instead,
+        for relations too wide for that.
 
-        :param randomize: Flag to trigger randomization.
+        :param randomize: Flag to trigger randomization (exhaustive search only).
+        :param polynomial: Flag to use the polynomial-time Tsou-Fischer algorithm.
         :returns: A list of relations which will be the BCNF decomposition.
         '''
 
-        decomp_list = []
-        sortedSubsetList = sorted(self.subsets(rel))
+        relMask = self._mask(rel)
+        if polynomial:
+            decomp = self._tsou_fischer_decomp(relMask)
+        else:
+            decomp = self._find_bcnf_decomp_masks(relMask, randomize)
+        return [self._rel(each) for each in decomp]
+
+    def _iter_determined_pairs(self, relMask):
+        '''
+        Lazily yields (A, B, (rel - AB)+ within rel) for every pair of
+        attributes A != B with A in (rel - AB)+. If there is no such pair,
+        `rel` is in BCNF (Tsou & Fischer). The closure stops once it holds
+        both A and B, so it is only complete when it misses B.
+        '''
+        
+        candidates = relMask
+        while candidates:
+            bitA = candidates & -candidates
+            candidates ^= bitA
+            if not self._determines(relMask & ~bitA, bitA):
+                continue  # then A is not in (rel - AB)+ for any B either
+            others = relMask & ~bitA
+            while others:
+                bitB = others & -others
+                others ^= bitB
+                subset = relMask & ~bitA & ~bitB
+                if subset == 0:
+                    continue
+                cl = self._closure_mask(subset, goal=bitA | bitB) & relMask
+                if cl & bitA:
+                    yield bitA, bitB, cl
+
+    def _determined_pair(self, relMask):
+        # The first pair of _iter_determined_pairs, or None if `rel` is in BCNF
+        for bitA, bitB, _ in self._iter_determined_pairs(relMask):
+            return bitA, bitB
+        return None
+
+    def _tsou_fischer_decomp(self, relMask):
+        '''
+        Tsou-Fischer BCNF decomposition, in polynomial time.
+        Shrinks the remaining relation Z to a BCNF fragment Y by dropping B
+        whenever some A is in (Y - AB)+. Then Y - A -> A, so splitting Z into
+        Y and Z - A is lossless, and the loop goes on with Z - A.
+        '''
+        
+        decomp = []
+        remaining = relMask
+        while True:
+            fragment = remaining
+            lastA = 0
+            pair = self._determined_pair(fragment)
+            while pair is not None:
+                lastA, bitB = pair
+                fragment &= ~bitB
+                pair = self._determined_pair(fragment)
+            decomp.append(fragment)
+            if fragment == remaining:
+                break
+            remaining &= ~lastA
+        return self._drop_subsumed(decomp)
+
+    def _find_bcnf_decomp_masks(self, relMask, randomize):
+        subsetList = self._iter_subset_masks(relMask)
         if randomize:
-            shuffle(sortedSubsetList)
-        for subset in sortedSubsetList:
-            if len(subset) > 0:
-                cl = self.closure(subset) & rel
-                if subset.issubset(cl) and subset != cl and cl.issubset(rel) and cl != rel:
-                    r1 = cl
-                    r2 = subset | (rel - cl)
-                    decomp_list += self.find_bcnf_decomp(r1, randomize=randomize)
-                    decomp_list += self.find_bcnf_decomp(r2, randomize=randomize)
-                    break
-        if len(decomp_list) == 0:
-            return [rel]
-        return decomp_list
+            subsetList = list(subsetList)
+            shuffle(subsetList)
+        for subset in subsetList:
+            cl = self._violating_closure(subset, relMask)
+            if cl is not None:
+                r1 = cl
+                r2 = subset | (relMask & ~cl)
+                return self._find_bcnf_decomp_masks(r1, randomize) \
+                        + self._find_bcnf_decomp_masks(r2, randomize)
+        return [relMask]
 
-    def is_dependency_preserving(self, rel1, rel2):
+    def is_dependency_preserving(self, *rels):
         '''
-        Checks whether the decomposition of two relations (decomposed from one parent relation)
-        is dependency preserving or not.
+        Checks whether a decomposition (of one parent relation) is dependency preserving or not.
+        Uses the restricted closure algorithm: for each FD X -> Y, X is grown by
+        (X & Ri)+ & Ri over every fragment Ri until nothing changes, and the FD
+        is preserved iff Y ends up inside. No projection is ever built.
 
-        :param rel1: The first relation in the decomposition.
-        :param rel2: The second relation in the decomposition.
+        :param rels: The relations in the decomposition (or a single list of them).
         :returns: A boolean value.
         '''
 
-        solver1 = Solver(self.fdSet.get_sub_fdset(rel1))
-        solver2 = Solver(self.fdSet.get_sub_fdset(rel2))
-        
-        for eachFd in self.fdSet:
-            if not (solver1.implies(eachFd) or solver2.implies(eachFd)):
+        if len(rels) == 1 and isinstance(rels[0], (list, tuple)):
+            rels = rels[0]
+        fragments = [self._mask(each) for each in rels]
+        closure = self._closure_mask
+        for lhs, rhs in zip(self._index.lhs, self._index.rhs):
+            target = rhs & ~lhs
+            if target == 0 or any((lhs | rhs) & ~each == 0 for each in fragments):
+                continue
+            result = lhs
+            changed = True
+            while changed and target & ~result:
+                changed = False
+                for each in fragments:
+                    new = closure(result & each, goal=each) & each & ~result
+                    if new:
+                        result |= new
+                        changed = True
+            if target & ~result:
                 return False
         return True
 
@@ -287,85 +1369,379 @@ class Solver:
 
         :param rel1: The first relation.
         :param rel2: The second relation.
+        :param originalRel: The relation that was decomposed (rel1 | rel2 by default).
         :returns: Whether it is a lossless decomposition.
         '''
 
         if originalRel == None:
-            originalRel = set(self.completeRel)
-        intersect = rel1 & rel2
-        closure = self.closure(intersect, limit_to=originalRel)
-        return rel1.issubset(closure) or rel2.issubset(closure)
+            originalRel = set(rel1) | set(rel2)
+        return self.is_lossless(originalRel, [rel1, rel2])
 
-    def is_3nf(self, rel):
+    def is_lossless(self, rel, fragments):
         '''
-        Checks whether a relation is in BCNF. 
+        Checks if a relation is losslessly decomposed into any number of fragments
+        under the current solver's FD set, i.e. joining the fragments gives back
+        exactly the relation. The fragments have to cover the relation.
+        Two fragments are checked with one closure: they join losslessly iff
+        their intersection determines one of them. Otherwise, a tableau with one
+        row per fragment is chased (see _chase_lossless).
+
+        :param rel: The relation that was decomposed.
+        :param fragments: The relations it was decomposed into.
+        :returns: Whether it is a lossless decomposition.
+        '''
+
+        relMask = self._rel_mask(rel)
+        fragMasks = [self._mask(each) for each in fragments]
+        covered = 0
+        for mask in fragMasks:
+            if mask & ~relMask:
+                return False
+            covered |= mask
+        if covered != relMask:
+            return False
+        if any(mask == relMask for mask in fragMasks):
+            return True
+        if len(fragMasks) == 2:
+            mask1, mask2 = fragMasks
+            # If mask1 is not reached, the goal-directed closure ran to its fixpoint
+            closure = self._closure_mask(mask1 & mask2, goal=mask1)
+            return mask1 & ~closure == 0 or mask2 & ~closure == 0
+        return self._chase_lossless(relMask, fragMasks)
+
+    def _chase_lossless(self, relMask, fragMasks):
+        '''
+        Tableau chase for the lossless-join test.
+        Symbols are plain ints kept in a union-find forest, where 0 is the
+        distinguished symbol of every column (it always wins a union, so a
+        distinguished cell stays distinguished). Columns outside `rel` that the
+        FDs mention get a fresh symbol in every row, which makes chasing with
+        the FD set itself equivalent to chasing with its projection onto `rel`.
+        Each FD pass groups rows by the symbols of its LHS in a dict, so rows
+        are never compared pairwise. The chase stops as soon as a row is
+        distinguished on all of `rel`, or when a full pass changes nothing.
+        '''
+
+        index = self._index
+        fds = [(lhs, rhs & ~lhs) for lhs, rhs in zip(index.lhs, index.rhs) if rhs & ~lhs]
+        columns = {}  # attribute bit -> column number
+        remaining = relMask | self._fullMask
+        while remaining:
+            bit = remaining & -remaining
+            remaining ^= bit
+            columns[bit] = len(columns)
+
+        def column_list(mask):
+            result = []
+            while mask:
+                bit = mask & -mask
+                mask ^= bit
+                result.append(columns[bit])
+            return result
+
+        fds = [(column_list(lhs), column_list(rhs)) for lhs, rhs in fds]
+        relColumns = column_list(relMask)
+        parent = [0]
+        rows = []
+        for fragMask in fragMasks:
+            row = []
+            for bit in columns:
+                if bit & fragMask:
+                    row.append(0)
+                else:
+                    row.append(len(parent))
+                    parent.append(len(parent))
+            rows.append(row)
+
+        def find(symbol):
+            root = symbol
+            while parent[root] != root:
+                root = parent[root]
+            while parent[symbol] != root:  # path compression
+                parent[symbol], symbol = root, parent[symbol]
+            return root
+
+        changed = True
+        while changed:
+            changed = False
+            for lhsColumns, rhsColumns in fds:
+                groups = {}
+                distinguished = False
+                for row in rows:
+                    first = groups.setdefault(tuple([find(row[each]) for each in lhsColumns]), row)
+                    if first is row:
+                        continue
+                    for each in rhsColumns:
+                        a, b = find(first[each]), find(row[each])
+                        if a != b:
+                            if a > b:
+                                a, b = b, a
+                            parent[b] = a
+                            changed = True
+                            distinguished = distinguished or a == 0
+                if distinguished and any(all(find(row[each]) == 0 for each in relColumns)
+                                         for row in rows):
+                    return True
+        return False
+
+    def find_3nf_violation(self, rel=None):
+        '''
+        Finds an FD that stops a relation from being in 3NF.
+        Searched the same way as find_bcnf_violation(), and prime attributes
+        are only computed once a BCNF violation turns up.
+
+        :param rel: The relation to check.
+        :returns: A violating FD X -> Y (X is not a superkey and Y is non-prime), or None.
+        '''
+        
+        violation = self._3nf_violation_masks(self._rel_mask(rel))
+        if violation is None:
+            return None
+        return FD(self._rel(violation[0]), self._rel(violation[1]))
+
+    def is_3nf(self, rel=None):
+        '''
+        Checks whether a relation is in 3NF. 
         Does so by checking whether any subset fulfils the following condition:
         >> subset is strict subset of subset's closure
         >> AND subset's closure is strict subset of original relation
-        >> AND subset's closure - subset does not include any prime attributes
-        If so, then the relation is NOT in BCNF.
+        >> AND subset's closure - subset includes a non-prime attribute
+        If so, then the relation is NOT in 3NF.
+        See find_3nf_violation() for how the subsets are searched.
 
         :param rel: The relation to check.
         :returns: A boolean.
         '''
         
-        if rel == None:
-            rel = set(self.completeRel)
-        for subset in self.subsets(rel):
-            if len(subset) > 0:
-                cl = self.closure(subset) & rel
-                if subset.issubset(cl) and subset != cl and cl.issubset(rel) and cl != rel:
-                    return (cl - subset) in self.prime_attrs()
-        return True
+        return self._3nf_violation_masks(self._rel_mask(rel)) is None
+
+    def find_3nf_synthesis(self, rel=None):
+        '''
+        Finds a 3NF decomposition of a relation with the synthesis algorithm.
+        FDs of a minimal basis are grouped by LHS into one relation each, a key
+        is added as its own relation if no relation contains one, and relations
+        contained in another relation are dropped.
+        The result is lossless and dependency-preserving, in polynomial time.
+
+        Sub-relations are synthesized from the projection of the FD set.
+
+        :param rel: The relation to decompose.
+        :returns: A list of relations which will be the 3NF decomposition.
+        '''
+        
+        relMask = self._rel_mask(rel)
+        if relMask & self._fullMask == self._fullMask:
+            cover = self._minimal_cover_masks()
+        else:
+            cover = self._project_masks(relMask)
+        groups = {}
+        for lhs, rhs in cover:
+            groups[lhs] = groups.get(lhs, lhs) | rhs
+        relations = list(groups.values())
+
+        if not any(self._determines(each, relMask) for each in relations):
+            core, never = self._key_bounds(relMask)
+            relations.append(self._minimize_superkey(relMask & ~never, relMask, core))
+        return [self._rel(each) for each in self._drop_subsumed(relations)]
+
+    def _drop_subsumed(self, relMasks):
+        '''
+        Drops every relation that is contained in another one (and duplicates).
+        Kept relations are indexed by attribute, so a relation is only compared
+        with the kept relations that share its rarest attribute.
+        The order of the remaining relations is preserved.
+        '''
+        
+        bySize = sorted(range(len(relMasks)), key=lambda i: -relMasks[i].bit_count())
+        postings = {}  # attribute bit -> kept relations containing it
+        kept = set()
+        for position in bySize:
+            mask = relMasks[position]
+            bits = []
+            remaining = mask
+            while remaining:
+                bit = remaining & -remaining
+                remaining ^= bit
+                bits.append(bit)
+            if not bits:
+                continue
+            rarest = min(bits, key=lambda bit: len(postings.get(bit, ())))
+            if any(mask & ~relMasks[other] == 0 for other in postings.get(rarest, ())):
+                continue
+            kept.add(position)
+            for bit in bits:
+                postings.setdefault(bit, []).append(position)
+        return [relMasks[i] for i in range(len(relMasks)) if i in kept]
 
     def find_minimal_basis(self):
-        # Step 1: Non-trivialize and decompose
-        fullyDecomposed = []
-        for eachFd in self.fdSet:  
-            eachFd = eachFd.untrivialize()
-            decomposed = eachFd.decompose()
-            for eachDecomp in decomposed:
-                fullyDecomposed.append(eachDecomp)
-       
-        # Step 2: Remove redundant attributes on LHS of each FD
-        newFdSet = []
-        for eachFd in fullyDecomposed:
-            newBefore = set()
-            if len(eachFd.lhs) == 1:
-                newFdSet.append(eachFd)
-                continue  # append and skip if LHS cannot be simplified
-            for eachRel in eachFd.lhs:
-                eachRel = set(eachRel)
-                lhsWithoutRel = eachFd.lhs - eachRel
-                closureWithoutRel = self.closure(lhsWithoutRel)
-                if not eachFd.rhs.issubset(closureWithoutRel):
-                    newBefore |= eachRel
-            if len(newBefore) == 0:
-                continue  # skip if completely redundant
-            newFd = FD(lhs=newBefore, rhs=eachFd.rhs)
-            if newFd not in newFdSet:
-                newFdSet.append(newFd)
+        '''
+        Returns a minimal basis (canonical cover) of the solver's FD set.
+        Every FD has a single attribute on its RHS, no redundant attribute on
+        its LHS, and no FD can be inferred from the others.
+
+        :returns: The minimal basis as a FD set.
+        '''
         
-        # Step 3: Remove redundant FDs
-        changesRemain = True
-        while changesRemain:
-            changesRemain = False
-            index = 0
-            while index < len(newFdSet):
-                eachFd = newFdSet[index]
-                # Make a solver that excludes only the current FD
-                # If the solver can infer the current FD, then it is redundant
-                fdSetWithoutFd = [fd for fd in newFdSet if fd != eachFd]
-                temp_solver = Solver(FDSet(*fdSetWithoutFd))
-                if not temp_solver.implies(eachFd):
-                    index += 1
-                else:
-                    changesRemain = True
-                    newFdSet.pop(index)
+        return FDSet(*[FD(self._rel(lhs), self._rel(rhs))
+                       for lhs, rhs in self._minimal_cover_masks()])
 
-        return FDSet(*newFdSet)
+    def canonical_basis(self):
+        '''
+        Returns the canonical (Duquenne-Guigues) basis of the solver's FD set.
+        It is the smallest FD set equivalent to the solver's, and it is unique:
+        two FD sets are equivalent iff their canonical bases are equal.
+        Every LHS is a pseudo-closed set and every RHS holds the rest of its closure.
+        The FDs are ordered by LHS size, then LHS attributes.
 
+        :returns: The canonical basis as a FD set.
+        '''
+        
+        fds = [FD(self._rel(lhs), self._rel(rhs)) for lhs, rhs in self._canonical_masks()]
+        return FDSet(*sorted(fds, key=lambda fd: (len(fd.lhs), fd.sortedLhs, fd.sortedRhs)))
 
+    def canonical_form(self):
+        '''
+        Returns the canonical basis as a frozenset of FDs, which compares equal
+        (and hashes the same) for equivalent FD sets. Use it as a dict key or
+        set member to group or deduplicate many FD sets at once.
+
+        :returns: A frozenset of FDs.
+        '''
+        
+        return frozenset(FD(self._rel(lhs), self._rel(rhs))
+                         for lhs, rhs in self._canonical_masks())
+
+    def _canonical_masks(self):
+        '''
+        Day's algorithm: every FD A -> B is first right-saturated to A -> A+.
+        Then, one at a time, each FD is taken out and its LHS is closed under
+        the FDs that are left. If that closure C already holds all of A+ the FD
+        is redundant, otherwise C -> A+ is put back. What remains is the
+        canonical basis (see canonical_basis()).
+        '''
+        
+        index = self._index
+        saturated = {}  # dict keeps the order and drops duplicates
+        for lhs in index.lhs:
+            saturated[(lhs, self._closure_mask(lhs))] = None
+        basis = _ClosureIndex(*zip(*saturated)) if saturated else _ClosureIndex()
+        result = []
+        for lhs, rhs in saturated:
+            basis.remove(lhs, rhs)
+            closure = basis.closure(lhs)
+            if closure != rhs:
+                basis.add(closure, rhs)
+                result.append((closure, rhs))
+        return [(lhs, rhs & ~lhs) for lhs, rhs in result]
+
+    def project(self, rel):
+        '''
+        Projects the solver's FD set onto a relation, i.e. finds the FDs of F+
+        whose attributes all lie inside `rel`.
+        Candidate LHSs are searched level by level, and are pruned when:
+        >> they contain a LHS that already determines all of `rel`
+        >> they contain an attribute that is on no LHS (it can only determine itself)
+        >> they contain an attribute determined by the rest of the LHS
+        Projections are cached per relation.
+
+        :param rel: The relation to project onto.
+        :returns: A FD set with a minimal basis of the projection.
+        '''
         
+        return FDSet(*[FD(self._rel(lhs), self._rel(rhs))
+                       for lhs, rhs in self._project_masks(self._rel_mask(rel))])
+
+    def _project_masks(self, relMask, budget=None):
+        # With a key search budget (see _key_budget), gives up and returns None
+        # as soon as it runs out; a partial projection is never cached
+        self._sync()
+        cached = self._projections.get(relMask)
+        if cached is not None:
+            return cached
+        closure = self._closure_mask
+
+        projected = []
+        emptyClosure = closure(0) & relMask
+        if emptyClosure:
+            projected.append((0, emptyClosure))
+        if emptyClosure != relMask:
+            candidates = relMask & self._lhsAll & ~emptyClosure
+            level = {0: emptyClosure}  # alive LHSs of the previous size
+            while level:
+                nextLevel = {}
+                for lhs in level:
+                    # Only add bits above the highest one, so each set is made once
+                    extensions = candidates & ~((1 << lhs.bit_length()) - 1)
+                    while extensions:
+                        bit = extensions & -extensions
+                        extensions ^= bit
+                        newLhs = lhs | bit
+                        subClosures = []
+                        remaining = newLhs
+                        while remaining:
+                            dropped = remaining & -remaining
+                            remaining ^= dropped
+                            subClosure = level.get(newLhs & ~dropped)
+                            if subClosure is None or subClosure & dropped:
+                                break  # a pruned subset, or a redundant attribute
+                            subClosures.append(subClosure)
+                        else:
+                            if budget is not None and self._out_of_budget(budget, 0):
+                                return None
+                            cl = closure(newLhs) & relMask
+                            derived = cl & ~newLhs
+                            for subClosure in subClosures:
+                                derived &= ~subClosure  # already implied by a subset
+                            if derived:
+                                projected.append((newLhs, derived))
+                            if cl != relMask:
+                                nextLevel[newLhs] = cl
+                level = nextLevel
+
+        cover = self._minimal_cover_masks(projected)
+        self._projections[relMask] = cover
+        return cover
 
+    def _minimal_cover_masks(self, fdMasks=None):
+        # Works on the solver's own FD set unless other FDs (implied by it)
+        # are given, e.g. the FDs of a projection
+        if fdMasks is None:
+            fdMasks = zip(self._index.lhs, self._index.rhs)
 
+        # Step 1: Non-trivialize and decompose
+        decomposed = {}  # dict keeps the order and drops duplicates
+        for lhs, rhs in fdMasks:
+            rhs &= ~lhs
+            while rhs:
+                bit = rhs & -rhs
+                rhs ^= bit
+                decomposed[(lhs, bit)] = None
+
+        # Step 2: Remove redundant attributes on LHS of each FD, in one pass.
+        # Dropping an attribute never invalidates earlier drops,
+        # because the reduced LHS is used for every later check.
+        reduced = {}
+        for lhs, rhs in decomposed:
+            remaining = lhs
+            while remaining:
+                bit = remaining & -remaining
+                remaining ^= bit
+                if self._determines(lhs & ~bit, rhs):
+                    lhs &= ~bit
+            reduced[(lhs, rhs)] = None
+        reduced = list(reduced)
+
+        # Step 3: Remove redundant FDs
+        # One index over the reduced FDs is built; an FD is tested by masking
+        # it (and every FD already dropped) out of that index. Dropping FDs
+        # only makes the others harder to infer, so one pass is enough.
+        cover = _ClosureIndex(*zip(*reduced)) if reduced else _ClosureIndex()
+        if self._stats is not None:
+            self._stats['index_builds'] += 1
+            cover.stats = self._stats
+        removed = set()
+        for index, (lhs, rhs) in enumerate(reduced):
+            removed.add(index)
+            if rhs & ~cover.closure(lhs, skip=removed, goal=rhs):
+                removed.discard(index)
+        return [fd for index, fd in enumerate(reduced) if index not in removed]
@@ -10,6 +10,8 @@ setup(name='FDSolver',
       url='https://github.com/SimJunYou/FDSolver',
       author='Sim Jun You',
       author_email='simjunyou99@gmail.com',
-      packages=find_packages(),
+      packages=find_packages(exclude=['benchmarks', 'benchmarks.*']),
+      python_requires='>=3.10',
+      extras_require={'numpy': ['numpy']},
       license='MIT license'
       ) # TODO: Fill in the rest of the stuff if necessary
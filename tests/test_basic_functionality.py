@@ -1,5 +1,5 @@
 import pytest
-from fdsolver.classes import FD, FDSet
+from fdsolver.classes import FD, FDSet, AttrUniverse
 
 def test_fd_decomposition():
     fd_abc_de = FD(set('ABC'), set('DE'))
@@ -18,4 +18,13 @@ def test_fd_union():
     unioned = fd_abc_d | fd_abc_e
     assert unioned == fd_abc_de
 
+def test_attr_universe_round_trip():
+    universe = AttrUniverse(set('CAB'))
+    assert universe.attrs == ['A', 'B', 'C']
+    assert universe.to_mask(set('AC')) == 0b101
+    assert universe.to_rel(0b110) == set('BC')
 
+    # Unseen attributes are interned without disturbing existing bits
+    assert universe.to_mask(set('D')) == 0b1000
+    assert 'D' in universe
+    assert len(universe) == 4
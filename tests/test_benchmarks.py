@@ -0,0 +1,22 @@
+from fdsolver.solver import Solver
+from benchmarks.generators import chain, random_fds, many_keys, wide_single_key
+from benchmarks.run import report
+
+def test_generators_are_deterministic():
+    assert random_fds(10, 20, seed=3) == random_fds(10, 20, seed=3)
+    assert wide_single_key(10) == wide_single_key(10)
+
+def test_generator_keys():
+    assert Solver(chain(10)[0]).keys(chain(10)[1]) == [{'A0'}]
+    assert len(Solver(many_keys(3)[0]).keys(many_keys(3)[1])) == 8
+    fdSet, rel = wide_single_key(12)
+    assert Solver(fdSet).keys(rel) == [{'K'}]
+
+def test_report_flags_regressions(capsys):
+    baseline = {'fast': {'seconds': 1.0}, 'slow': {'seconds': 1.0}}
+    results = [('fast', {'seconds': 1.1, 'peak_bytes': 0}),
+               ('slow', {'seconds': 3.0, 'peak_bytes': 0})]
+    collected, regressions = report(results, baseline, threshold=1.5)
+    assert set(collected) == {'fast', 'slow'}
+    assert regressions == ['slow']
+    assert 'SLOWER' in capsys.readouterr().out
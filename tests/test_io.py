@@ -1,6 +1,7 @@
 import pytest
 from fdsolver.classes import FD, FDSet
 from fdsolver.io import FDReader, FDWriter
+from fdsolver.solver import Solver
 
 def test_get_fdset():
     fd_abc_de = FD(set('ABC'), set('DE'))
@@ -24,6 +25,18 @@ def test_get_objs():
 
     assert outputList == [fd_abc_de, rel_ad, fd_bcd_ac, rel_c] 
 
+def test_iter_objs_is_lazy():
+    reader = FDReader('test_data/test_data_2.txt')
+    objs = reader.iter_objs()
+    assert next(objs) == FD(set('ABC'), set('DE'))
+    assert next(objs) == set('AD')
+    assert list(reader.iter_fds()) == [FD(set('ABC'), set('DE')), FD(set('BCD'), set('AC'))]
+
+def test_strict_reader_reports_line():
+    reader = FDReader('test_data/test_data_1.txt', strict=True)
+    with pytest.raises(ValueError, match='line 2'):
+        reader.get_fdset()
+
 # No need to test get_solver() since it's just a simple wrapper
 # of get_fdset()...
 
@@ -42,3 +55,61 @@ def test_write_objs_to_file(tmpdir):
         writer.write_obj(each)
 
     assert p.read_text(None) == proper_output
+
+def test_write_objs_single_call(tmpdir):
+    p = tmpdir.mkdir('write').join('write_test.txt')
+    fdset = FDSet(FD('A>B'), FD('B>C'))
+    writer = FDWriter(str(p))
+    writer.write_objs([set('A'), fdset])
+    assert p.read_text(None) == str(set('A')) + '\n' + str(fdset) + '\n'
+
+@pytest.mark.parametrize('index', [True, False])
+def test_binary_round_trip(tmpdir, index):
+    p = tmpdir.mkdir('binary').join('fds.bin')
+    fdset = FDSet(FD('ABC>DE'), FD('AD>C'), FD('BCD>AC'), FD('>F'))
+    FDWriter(str(p)).write_binary(fdset, index=index)
+
+    reader = FDReader(str(p))
+    assert reader.read_binary() == fdset
+    solver = reader.get_binary_solver()
+    assert solver.closure(set('AD')) == set('ACDF')
+    assert solver.keys() == Solver(fdset).keys()
+
+def test_binary_solver_builds_fds_lazily(tmpdir):
+    p = tmpdir.mkdir('binary').join('fds.bin')
+    fdset = FDSet(FD('A>B'), FD('B>C'))
+    FDWriter(str(p)).write_binary(fdset)
+    solver = FDReader(str(p)).get_binary_solver()
+    assert solver.closure(set('A')) == set('ABC')
+    assert solver._fdSet is None  # no FD objects so far
+    assert solver.fdSet == fdset
+    solver.fdSet.add_step(FD('C>D'))
+    assert solver.closure(set('A')) == set('ABCD')
+
+@pytest.mark.parametrize('attr_count', [20, 40, 100])
+def test_binary_mask_widths(tmpdir, attr_count):
+    # 3, 5 and 13 bytes per mask
+    p = tmpdir.mkdir('binary').join('fds.bin')
+    attrs = [chr(ord('A') + i // 26) + chr(ord('A') + i % 26) for i in range(attr_count)]
+    fdset = FDSet(*[FD({attrs[i]}, {attrs[i+1], attrs[-1]}) for i in range(attr_count - 1)])
+    FDWriter(str(p)).write_binary(fdset)
+    assert FDReader(str(p)).read_binary() == fdset
+    assert FDReader(str(p)).get_binary_solver().closure({attrs[0]}) == set(attrs)
+
+def test_binary_rejects_text_file():
+    with pytest.raises(ValueError):
+        FDReader('test_data/test_data_1.txt').read_binary()
+
+
+@pytest.mark.parametrize('index', [True, False])
+def test_binary_rejects_truncated_file(tmpdir, index):
+    p = tmpdir.mkdir('binary').join('fds.bin')
+    fdset = FDSet(*[FD({f'A{i}'}, {f'A{i+1}'}) for i in range(30)])
+    FDWriter(str(p)).write_binary(fdset, index=index)
+    data = p.read_binary()
+    for cut in (1, 40, len(data) - 20):
+        p.write_binary(data[:-cut])
+        with pytest.raises(ValueError, match='truncated'):
+            FDReader(str(p)).read_binary()
+        with pytest.raises(ValueError, match='truncated'):
+            FDReader(str(p)).get_binary_solver()
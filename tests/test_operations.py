@@ -44,3 +44,47 @@ def test_fdset_contains(fdsets):
 
     assert fd_cde_bc in fdset_1
     assert fd_de_b in fdset_3 
+
+def test_fd_hashing():
+    fd_abc_de = FD(set('ABC'), set('DE'))
+    assert hash(fd_abc_de) == hash(FD('ABC>DE'))
+    assert len({fd_abc_de, FD('ABC>DE'), FD('ABC>D')}) == 2
+    with pytest.raises(AttributeError):
+        fd_abc_de.lhs = set('A')
+
+def test_fd_slots_and_lazy_sorting():
+    import pickle
+    fd_cb_ed = FD('cb>ed')
+    assert not hasattr(fd_cb_ed, '__dict__')
+    assert fd_cb_ed.lhs == frozenset('BC') and fd_cb_ed.rhs == frozenset('DE')
+    assert str(fd_cb_ed) == 'B,C -> D,E'
+    assert fd_cb_ed.sortedLhs is fd_cb_ed.sortedLhs  # worked out once
+    copied = pickle.loads(pickle.dumps(fd_cb_ed))
+    assert copied == fd_cb_ed and hash(copied) == hash(fd_cb_ed)
+
+def test_fdset_dedup_and_setitem(fdsets):
+    fdset_1, _, fdset_3 = fdsets
+    fd_de_b = FD(set('DE'), set('B'))
+    fd_ad_e = FD(set('AD'), set('E'))
+
+    fdset_3.add_step(FD('AD>E'))  # already present
+    assert len(fdset_3) == 3
+
+    fdset_3[2] = FD('DE>C')
+    assert fd_de_b not in fdset_3
+    assert FD('DE>C') in fdset_3
+    assert fd_ad_e in fdset_3
+
+def test_fdset_remove_step_and_pickle(fdsets):
+    import pickle
+    fdset_1 = fdsets[0]
+    fdset_1.remove_step(FD('AD>E'))
+    assert FD('AD>E') not in fdset_1 and len(fdset_1) == 3
+    with pytest.raises(KeyError):
+        fdset_1.remove_step(FD('AD>E'))
+    assert pickle.loads(pickle.dumps(fdset_1)) == fdset_1
+
+def test_fdset_equality_ignores_order():
+    assert FDSet(FD('A>B'), FD('B>C')) == FDSet(FD('B>C'), FD('A>B'))
+    assert FDSet(FD('A>B')) != FDSet(FD('A>B'), FD('B>C'))
+
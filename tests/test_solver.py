@@ -1,4 +1,5 @@
 import pytest
+from time import perf_counter
 from fdsolver.classes import FD, FDSet
 from fdsolver.solver import Solver
 from fdsolver.io import FDReader
@@ -19,6 +20,13 @@ def test_rel_generate_subsets(make_solver_1):
     assert set('ABC') in subsets
     assert len(subsets) == 7
 
+def test_rel_iter_subsets_lazy(make_solver_1):
+    solver_1 = make_solver_1
+    subsets = solver_1.iter_subsets(set('ABCDEFGHIJKLMNOPQRSTUVWXY'))
+    assert next(subsets) == set('A')  # nothing else is materialized
+    sizes = [len(each) for each in solver_1.iter_subsets(set('ABCD'))]
+    assert sizes == sorted(sizes)
+
 def test_solver_closure(make_solver_1, make_solver_2):
     solver_1 = make_solver_1
 
@@ -34,6 +42,134 @@ def test_solver_closure(make_solver_1, make_solver_2):
     assert solver_2.closure(set('B')) == set('B')
     assert solver_2.closure(set('AC')) == set('ABCDE')
 
+def test_solver_closure_matches_fixpoint(make_solver_4):
+    # The indexed closure must agree with the naive fixpoint definition
+    solver_4 = make_solver_4
+    for subset in solver_4.subsets(set('ABCDE')):
+        expected = set(subset)
+        changed = True
+        while changed:
+            changed = False
+            for fd in solver_4.fdSet:
+                if fd.lhs.issubset(expected) and not fd.rhs.issubset(expected):
+                    expected |= fd.rhs
+                    changed = True
+        assert solver_4.closure(subset) == expected
+
+def test_solver_closure_goal_and_limit(make_solver_1):
+    solver_1 = make_solver_1
+    # A goal stops the closure early, but always reaches the goal if it can
+    assert set('C').issubset(solver_1.closure(set('A'), goal=set('C')))
+    assert not set('E').issubset(solver_1.closure(set('A'), goal=set('C')))
+    assert solver_1.closure(set('B'), goal=set('A')) == set('BCDE')
+    # Nothing outside limit_to is derived, so the chain stops at C
+    assert solver_1.closure(set('A'), limit_to=set('ABDE')) == set('AB')
+    # Attributes of rel outside limit_to are kept, but never used to derive
+    limited = Solver(FDSet(FD('A>B'), FD('B>C'), FD('X>C')))
+    assert limited.closure(set('AX'), limit_to=set('AC')) == set('AX')
+    assert limited.closure(set('AX'), limit_to=set('ABC')) == set('ABCX')
+
+def test_solver_closure_cache(make_solver_1):
+    solver_1 = make_solver_1
+    solver_1.closure(set('B'))
+    solver_1.closure(set('B'))
+    info = solver_1.cache_info()
+    assert info['hits'] == 1 and info['misses'] == 1 and info['size'] == 1
+
+    tiny_solver = Solver(FDSet(FD('A>B')), cache_size=2)
+    for each in ('A', 'B', 'C'):
+        tiny_solver.closure(set(each))
+    assert tiny_solver.cache_info()['size'] == 2
+
+def test_solver_stats():
+    solver = Solver(FDSet(FD('A>B'), FD('B>C'), FD('CD>E')))
+    solver.closure(set('A'))
+    assert solver.stats() is None and 'closure' not in vars(solver)
+
+    solver.enable_stats()
+    assert solver.closure(set('A')) == set('ABC')  # cached, so no new closure
+    solver.closure(set('B'))
+    solver.subsets(set('AB'))
+    stats = solver.stats()
+    assert stats['closures'] == 1 and stats['fd_firings'] == 1
+    assert stats['cache_hits'] == 1 and stats['subsets'] == 3
+    assert stats['methods']['closure']['calls'] == 2
+    assert stats['methods']['subsets']['calls'] == 1
+
+    solver.fdSet.add_step(FD('E>F'))
+    solver.find_minimal_basis()
+    assert solver.stats()['index_builds'] == 1  # the cover; the new FD is added in place
+
+    solver.reset_stats()
+    assert solver.stats()['closures'] == 0 and solver.stats()['methods'] == {}
+    solver.enable_stats(False)
+    assert solver.stats() is None and 'closure' not in vars(solver)
+    assert solver.closure(set('CD')) == set('CDEF')
+
+def test_solver_cache_invalidation(make_solver_1):
+    solver_1 = make_solver_1
+    assert solver_1.closure(set('E')) == set('E')
+    solver_1.fdSet.add_step(FD('E>F'))
+    assert solver_1.closure(set('E')) == set('EF')
+    assert 'F' in solver_1.completeRel
+
+    solver_1.fdSet[0] = FD('A>C')
+    assert solver_1.closure(set('A')) == set('ACDEF')
+    assert solver_1.keys() == [set('AB')]
+
+def test_solver_incremental_updates():
+    fdset = FDSet(FD('A>B'), FD('C>D'))
+    solver = Solver(fdset)
+    assert solver.closure(set('A')) == set('AB')
+    assert solver.closure(set('C')) == set('CD')
+
+    fdset.add_step(FD('B>E'))
+    assert solver.completeRel == set('ABCDE')
+    assert solver.cache_info()['size'] == 2  # A+ was extended, C+ kept
+    assert solver.closure(set('A')) == set('ABE')
+    assert solver.cache_info()['hits'] == 1
+
+    fdset.remove_step(FD('C>D'))
+    assert solver.closure(set('C')) == set('C')
+    fdset[0] = FD('A>C')
+    assert solver.closure(set('A')) == set('AC')
+    assert solver.keys() == Solver(fdset).keys()
+
+def test_solver_copied_fdset_is_independent():
+    import copy
+    fdset = FDSet(FD('A>B'))
+    solver = Solver(fdset)
+    assert solver.closure(set('A')) == set('AB')
+    copied = copy.copy(fdset)
+    copied.add_step(FD('B>C'))
+    assert len(fdset) == 1 and len(copied) == 2
+    assert solver.closure(set('A')) == set('AB')
+    assert Solver(copied).closure(set('A')) == set('ABC')
+
+def test_solver_closure_many(make_solver_2):
+    solver_2 = make_solver_2
+    rels = [set('A'), set('B'), set('AC'), set('CX')]
+    assert solver_2.closure_many(rels) == [solver_2.closure(each) for each in rels]
+    assert solver_2.closure_many(rels, goal=set('ABCDE')) == [False, False, True, False]
+
+def test_solver_closure_many_without_numpy(make_solver_2, monkeypatch):
+    monkeypatch.setattr('fdsolver.solver.np', None)
+    solver_2 = make_solver_2
+    assert solver_2.closure_many([set('AC'), set('C')]) == [set('ABCDE'), set('CD')]
+    assert len(solver_2.superkeys(set('ABCDE'))) == 8
+
+def test_solver_closure_many_batches(make_solver_2):
+    solver_2 = make_solver_2
+    rels = [set('A'), set('B'), set('AC'), set('CX'), set('C')]
+    expected = [solver_2.closure(each) for each in rels]
+    solver_2._batchSize = 2
+    assert solver_2.closure_many(rels) == expected
+    # FD matrices that do not fit the memory cap are never built
+    solver_2._batchMemory = 1
+    assert solver_2._batch_size() == 1 and not solver_2._vectorized()
+    assert solver_2.closure_many(rels) == expected
+    assert len(solver_2.superkeys(set('ABCDE'))) == 8
+
 def test_solver_superkeys(make_solver_2):
     solver_2 = make_solver_2
     sol2_sk = solver_2.superkeys(set('ABCDE'))
@@ -47,15 +183,120 @@ def test_solver_superkeys(make_solver_2):
     assert set('AC') in sol2_sk
     assert len(sol2_sk) == 8
 
+def test_solver_iter_superkeys_and_keys(make_solver_4):
+    solver_4 = make_solver_4
+    assert list(solver_4.iter_superkeys()) == solver_4.superkeys()
+    assert next(solver_4.iter_superkeys()) == set('ACD')
+    assert sorted(map(sorted, solver_4.iter_keys())) == [list('ACD'), list('ACE')]
+    assert sorted(map(sorted, solver_4.iter_keys(set('BCDE')))) == [list('CD'), list('CE')]
+    first = list(solver_4.iter_keys(max_keys=1))
+    assert len(first) == 1 and first[0] in solver_4.keys()
+
+def test_solver_search_keys_budgets():
+    # Ai <-> Bi for 6 pairs: 64 keys of 6 attributes each
+    fdset = FDSet()
+    for i in range(6):
+        fdset.add_step(FD({f'A{i}'}, {f'B{i}'}))
+        fdset.add_step(FD({f'B{i}'}, {f'A{i}'}))
+    solver = Solver(fdset)
+
+    result = solver.search_keys(max_keys=3)
+    assert len(result['keys']) == 3 and all(len(key) == 6 for key in result['keys'])
+    assert result['complete'] == False and result['stopped_by'] == 'max_keys'
+
+    # The budget is checked between minimizations, which take at most 12 closures
+    result = solver.search_keys(max_closures=50)
+    assert result['stopped_by'] == 'max_closures' and 50 <= result['closures'] <= 62
+    assert 0 < len(result['keys']) < 64
+
+    assert solver.search_keys(timeout=0)['stopped_by'] == 'timeout'
+    result = solver.search_keys()
+    assert result['complete'] and len(result['keys']) == 64
+    assert result['keys'] == solver.keys()
+    # Most closures are cached by now, and cache hits are free
+    assert solver.search_keys()['closures'] < result['closures'] // 10
+
+def test_solver_search_keys_budgets_projection():
+    # Projecting onto rel (no Ci) takes about 3^12 closures, and has to be cut short
+    fdset = FDSet()
+    for i in range(12):
+        fdset.add_step(FD({f'A{i}'}, {f'C{i}'}))
+        fdset.add_step(FD({f'B{i}'}, {f'C{i}'}))
+    fdset.add_step(FD({f'C{i}' for i in range(12)}, {'D'}))
+    fdset.add_step(FD({'D'}, {'A0', 'B0'}))
+    solver = Solver(fdset)
+    rel = {f'{x}{i}' for x in 'AB' for i in range(12)} | {'D'}
+
+    result = solver.search_keys(rel, max_closures=100)
+    assert result['stopped_by'] == 'max_closures' and result['closures'] < 200
+    # The first key needs no projection
+    assert len(result['keys']) == 1 and len(result['keys'][0]) == 23
+    start = perf_counter()
+    assert solver.search_keys(rel, timeout=0.05)['stopped_by'] == 'timeout'
+    assert perf_counter() - start < 1
+
+def test_solver_search_keys_wide_schema():
+    from benchmarks.generators import random_fds
+    # 23 attributes that may or may not be in a key, but only 2 keys
+    fdset, rel = random_fds(34, 40, seed=5)
+    solver = Solver(fdset)
+    result = solver.search_keys(max_closures=1000)
+    assert result['complete'] and result['stopped_by'] is None
+    assert result['keys'] == Solver(fdset).keys() and len(result['keys']) == 2
+
 def test_solver_keys(make_solver_2):
     solver_2 = make_solver_2
     sol2_keys = solver_2.keys(set('ABCDE'))
     assert sol2_keys[0] == set('AC')
     assert len(sol2_keys) == 1
 
+def test_solver_multiple_keys(make_solver_4):
+    solver_4 = make_solver_4
+    assert solver_4.keys() == [set('ACD'), set('ACE')]
+    # Attributes outside the FD set are part of every key
+    assert solver_4.keys(set('ABCDEF')) == [set('ACDF'), set('ACEF')]
+    # Sub-relations do not cover the FD set
+    assert solver_4.keys(set('BCDE')) == [set('CD'), set('CE')]
+
+def test_solver_parallel_keys(make_solver_2, make_solver_4):
+    solver_4 = make_solver_4
+    assert solver_4.keys(workers=2) == solver_4.keys()
+    assert solver_4.keys(set('BCDE'), workers=2) == [set('CD'), set('CE')]
+    solver_2 = make_solver_2
+    sol2_sk = solver_2.superkeys(set('ABCDE'), workers=2)
+    assert len(sol2_sk) == 8
+    assert sol2_sk[0] == set('AC')
+
+def test_solver_parallel_keys_cost():
+    from benchmarks.generators import random_fds, many_keys
+    # 23 attributes that may or may not be in a key, but only 2 keys
+    for fdset, rel in (random_fds(34, 40, seed=5), many_keys(6)):
+        sequential = Solver(fdset)
+        sequential.enable_stats()
+        parallel = Solver(fdset)
+        parallel._parallelMinimum = 1  # send every round to the pool
+        parallel.enable_stats()
+        assert parallel.keys(workers=2) == sequential.keys()
+        # Workers have no closure cache, but do no more work than that
+        assert parallel.stats()['closures'] <= 3 * sequential.stats()['closures']
+
 def test_solver_prime_attrs(make_solver_2):
     solver_2 = make_solver_2
     assert solver_2.prime_attrs(set('ABCDE')) == set('AC')
+
+def test_solver_key_queries(make_solver_2, make_solver_4):
+    solver_2, solver_4 = make_solver_2, make_solver_4
+    assert solver_2.is_superkey(set('AC'), set('ABCDE'))
+    assert solver_2.is_superkey(set('ABC'), set('ABCDE'))
+    assert not solver_2.is_superkey(set('AB'), set('ABCDE'))
+    assert solver_2.is_key(set('AC'), set('ABCDE'))
+    assert not solver_2.is_key(set('ABC'), set('ABCDE'))
+    assert solver_2.is_prime('A', set('ABCDE'))
+    assert not solver_2.is_prime('B', set('ABCDE'))
+    assert not solver_2.is_prime('Z')
+    for key in solver_4.keys():
+        assert solver_4.is_key(key)
+        assert all(solver_4.is_prime(attr) for attr in key)
     
 def test_solver_is_bcnf(make_solver_3):
     solver_3 = make_solver_3
@@ -65,6 +306,20 @@ def test_solver_is_bcnf(make_solver_3):
     assert solver_3.is_bcnf(set('ADE')) == True
     assert solver_3.is_bcnf(set('ACE')) == True
 
+def test_solver_normal_form_witnesses(make_solver_3, make_solver_4):
+    solver_3 = make_solver_3
+    # Full schema: the offending FD from the set is returned
+    assert solver_3.find_bcnf_violation(set('ABCD')) == FD('A>B')
+    assert solver_3.find_3nf_violation(set('ABCD')) == FD('A>B')
+    # Sub-relation: the witness comes from the projected FDs
+    violation = solver_3.find_bcnf_violation(set('ACDE'))
+    assert violation == FD('AC>D')
+    assert solver_3.find_bcnf_violation(set('ACE')) is None
+
+    solver_4 = make_solver_4
+    assert solver_4.find_3nf_violation(set('ACDE')) is None
+    assert solver_4.find_3nf_violation(set('ABCDE')).rhs == set('B')
+
 @pytest.mark.parametrize('execution_count', range(10))
 def test_solver_bcnf_decomp(make_solver_3, execution_count):
     solver_3 = make_solver_3
@@ -72,10 +327,57 @@ def test_solver_bcnf_decomp(make_solver_3, execution_count):
     for each in bcnf_list:
         assert solver_3.is_bcnf(each) == True
 
+def test_solver_project(make_solver_1, make_solver_3):
+    solver_1 = make_solver_1
+    # A -> C only holds through B, which is projected away
+    assert solver_1.project(set('ACE')) == FDSet(FD('A>C'), FD('C>E'))
+    solver_3 = make_solver_3
+    assert solver_3.project(set('ACD')) == FDSet(FD('AC>D'))
+    assert solver_3.project(set('CDE')) == FDSet()
+
+def test_solver_bcnf_decomp_polynomial(make_solver_3, make_solver_4):
+    for solver in (make_solver_3, make_solver_4):
+        bcnf_list = solver.find_bcnf_decomp(set('ABCDE'), polynomial=True)
+        assert set().union(*bcnf_list) == set('ABCDE')
+        for each in bcnf_list:
+            assert solver.is_bcnf(each) == True
+
+def test_solver_bcnf_decomp_polynomial_wide():
+    # A 40 attribute chain, far beyond what the subset search can handle
+    attrs = ['A%d' % i for i in range(40)]
+    solver = Solver(FDSet(*[FD({attrs[i]}, {attrs[i+1]}) for i in range(39)]))
+    bcnf_list = solver.find_bcnf_decomp(set(attrs), polynomial=True)
+    assert len(bcnf_list) == 39
+    for each in bcnf_list:
+        assert len(each) == 2 and solver.is_bcnf(each)
+    assert solver.is_lossless(set(attrs), bcnf_list)
+    assert not solver.is_lossless(set(attrs), bcnf_list[1:] + [{attrs[0], attrs[2]}])
+
 def test_solver_is_lossless_decomp(make_solver_3):
     solver_3 = make_solver_3
     assert not solver_3.is_lossless_decomp(set('ACE'), set('BD'))
     assert solver_3.is_lossless_decomp(set('ACED'), set('ACEB'))
+    # Not a decomposition of the original relation
+    assert not solver_3.is_lossless_decomp(set('ACED'), set('ACEB'), set('ABCDEF'))
+
+def test_solver_is_lossless(make_solver_3, make_solver_4):
+    solver = Solver(FDSet(FD('A>B'), FD('C>D'), FD('BD>E')))
+    assert solver.is_lossless(set('ABCDE'), [set('AB'), set('CD'), set('ACE')])
+    assert not solver.is_lossless(set('ABCDE'), [set('AB'), set('CD'), set('BDE')])
+    assert not solver.is_lossless(set('ABCDE'), [set('AB'), set('CD')])  # E is lost
+    for solver in (make_solver_3, make_solver_4):
+        for polynomial in (False, True):
+            bcnf_list = solver.find_bcnf_decomp(set('ABCDE'), polynomial=polynomial)
+            assert solver.is_lossless(set('ABCDE'), bcnf_list)
+
+def test_solver_is_dependency_preserving():
+    solver = Solver(FDSet(FD('A>B'), FD('B>C'), FD('C>A')))
+    # C -> A is not inside either fragment, but follows from C -> B -> A
+    assert solver.is_dependency_preserving(set('AB'), set('BC'))
+
+    solver = Solver(FDSet(FD('AB>C'), FD('C>B')))
+    assert not solver.is_dependency_preserving(set('AC'), set('BC'))
+    assert solver.is_dependency_preserving([set('AC'), set('BC'), set('ABC')])
 
 def test_solver_is_3nf(make_solver_4):
     solver_4 = make_solver_4
@@ -85,6 +387,14 @@ def test_solver_is_3nf(make_solver_4):
     assert solver_4.is_bcnf(set('CDE')) == True
     assert solver_4.is_bcnf(set('BCD')) == True
 
+def test_solver_is_3nf_prime_rhs(make_solver_2, make_solver_4):
+    solver_2 = make_solver_2
+    solver_4 = make_solver_4
+    assert solver_2.is_3nf(set('ABCDE')) == False
+    assert solver_4.is_3nf(set('ABCDE')) == False
+    assert solver_4.is_3nf(set('ACDE')) == True  # every attribute is prime
+    assert solver_4.is_3nf(set('BDE')) == True
+
 def test_solver_find_minimal_basis(make_solver_4):
     solver_4 = make_solver_4
     minbasis = solver_4.find_minimal_basis()
@@ -99,6 +409,66 @@ def test_solver_find_minimal_basis(make_solver_4):
 
     assert not redundancy_exists
 
+def test_solver_find_minimal_basis_is_equivalent(make_solver_4):
+    solver_4 = make_solver_4
+    minbasis = solver_4.find_minimal_basis()
+    minbasis_solver = Solver(minbasis)
+
+    for eachFd in solver_4.fdSet:
+        assert minbasis_solver.implies(eachFd)
+    for eachFd in minbasis:
+        assert len(eachFd.rhs) == 1
+        assert solver_4.implies(eachFd)
+        for eachAttr in eachFd.lhs:
+            assert not solver_4.implies(FD(eachFd.lhs - {eachAttr}, eachFd.rhs))
+
+def test_solver_covers_and_equivalent(make_solver_4):
+    split = Solver(FDSet(FD('A>B'), FD('A>C')))
+    merged = FDSet(FD('A>BC'))
+    assert split.fdSet != merged
+    assert split.equivalent(merged) and split.covers(merged)
+    assert split.covers(FDSet(FD('A>B')))
+    assert not Solver(FDSet(FD('A>B'))).covers(merged)
+    assert not split.equivalent(FDSet(FD('A>B'), FD('B>C')))
+
+    solver_4 = make_solver_4
+    assert solver_4.equivalent(solver_4.find_minimal_basis())
+    assert solver_4.equivalent(Solver(solver_4.canonical_basis()))
+
+def test_solver_canonical_basis():
+    # The smallest equivalent FD set, with every RHS saturated
+    solver = Solver(FDSet(FD('A>B'), FD('B>C'), FD('A>C'), FD('AB>C')))
+    assert solver.canonical_basis() == FDSet(FD('A>BC'), FD('B>C'))
+    assert list(solver.canonical_basis()) == [FD('A>BC'), FD('B>C')]
+
+    fdsets = [FDSet(FD('A>B'), FD('A>C')), FDSet(FD('A>BC')),
+              FDSet(FD('A>C'), FD('A>B'), FD('AB>C')), FDSet(FD('A>B'))]
+    groups = {}
+    for fdset in fdsets:
+        groups.setdefault(Solver(fdset).canonical_form(), []).append(fdset)
+    assert len(groups) == 2
+    assert len(groups[Solver(FDSet(FD('A>BC'))).canonical_form()]) == 3
+
+def test_solver_3nf_synthesis(make_solver_4):
+    solver_4 = make_solver_4
+    decomp = solver_4.find_3nf_synthesis()
+    assert set().union(*decomp) == set('ABCDE')
+    for each in decomp:
+        assert solver_4.is_3nf(each)
+    # Lossless: some relation contains a key
+    assert any(set('ABCDE').issubset(solver_4.closure(each)) for each in decomp)
+    # Dependency-preserving: every FD of the minimal basis fits in one relation
+    for eachFd in solver_4.find_minimal_basis():
+        assert any(eachFd.is_contained_in(each) for each in decomp)
+
+def test_solver_3nf_synthesis_adds_key(make_solver_3):
+    solver_3 = make_solver_3
+    decomp = solver_3.find_3nf_synthesis(set('ABCDE'))
+    assert set('ACE') in decomp
+    # Sub-relations are synthesized from the projected FDs
+    assert solver_3.find_3nf_synthesis(set('ACD')) == [set('ACD')]
+    assert solver_3.find_3nf_synthesis(set('ABC')) == [set('AB'), set('AC')]
+
 '''
 def test_interactive_bcnf_decomp(make_solver_3):
     solver_3 = make_solver_3